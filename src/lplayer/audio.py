@@ -28,15 +28,80 @@ import mutagen
 import hashlib
 import base64
 import os
-from .utils import create_thumbnail_for_audio
+from . import comun
+from .metadatacache import metadata_cache
 
+BLOCK_SIZE = 65536
 
-def md5(fname):
-    hash_md5 = hashlib.md5()
+
+def file_id(fname):
+    '''
+    Identity of an audio file: its size and a BLAKE2 digest of the head,
+    middle and tail blocks. Only reads 3 blocks whatever the file size
+    '''
+    size = os.path.getsize(fname)
+    hash_blake2 = hashlib.blake2b(digest_size=16)
+    with open(fname, "rb") as f:
+        if size <= 3 * BLOCK_SIZE:
+            hash_blake2.update(f.read())
+        else:
+            hash_blake2.update(f.read(BLOCK_SIZE))
+            f.seek((size - BLOCK_SIZE) // 2)
+            hash_blake2.update(f.read(BLOCK_SIZE))
+            f.seek(size - BLOCK_SIZE)
+            hash_blake2.update(f.read(BLOCK_SIZE))
+    return '{0:x}-{1}'.format(size, hash_blake2.hexdigest())
+
+
+def content_hash(fname):
+    hash_blake2 = hashlib.blake2b(digest_size=16)
     with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        for chunk in iter(lambda: f.read(1048576), b""):
+            hash_blake2.update(chunk)
+    return hash_blake2.hexdigest()
+
+
+def is_legacy_hash(hash):
+    # md5 hex digests never contain the size separator
+    return '-' not in hash
+
+
+def collision_id(hash, content_hash):
+    '''
+    Id for a file whose sampled blocks match another one. Keeps the size
+    and the length of a file id, so it fits the position journal
+    '''
+    size, _ = hash.split('-', 1)
+    hash_blake2 = hashlib.blake2b(digest_size=16)
+    hash_blake2.update('{0}-{1}'.format(hash, content_hash).encode())
+    return '{0}-{1}'.format(size, hash_blake2.hexdigest())
+
+
+def migrate_hashes(audios):
+    '''
+    Move the md5 based hashes and their thumbnails to the sampled file id.
+    Returns True if any audio has changed
+    '''
+    changed = False
+    for audio in audios:
+        if not is_legacy_hash(audio['hash']) or\
+                not os.path.exists(audio['filepath']):
+            continue
+        try:
+            new_hash = file_id(audio['filepath'])
+        except Exception as e:
+            print(e)
+            continue
+        old_thumbnail = os.path.join(comun.THUMBNAILS_DIR,
+                                     '{0}.png'.format(audio['hash']))
+        new_thumbnail = os.path.join(comun.THUMBNAILS_DIR,
+                                     '{0}.png'.format(new_hash))
+        if os.path.exists(old_thumbnail) and\
+                not os.path.exists(new_thumbnail):
+            os.rename(old_thumbnail, new_thumbnail)
+        audio['hash'] = new_hash
+        changed = True
+    return changed
 
 
 def get_data_from_metadata(tags, info):
@@ -46,10 +111,53 @@ def get_data_from_metadata(tags, info):
     return ''
 
 
-def get_image_from_flac(audio):
+def get_track_number(audio):
+    '''
+    The track number from the tags of a mutagen file, '' if there is none
+    '''
+    if audio is None or audio.tags is None:
+        return ''
+    if type(audio.info) == mutagen.mp3.MPEGInfo:
+        if 'TRCK' in audio.tags.keys():
+            return str(audio.tags['TRCK'].text[0])
+    elif type(audio.info) == mutagen.mp4.MP4Info:
+        if 'trkn' in audio.tags.keys() and len(audio.tags['trkn']) > 0:
+            return str(audio.tags['trkn'][0][0])
+    else:
+        return get_data_from_metadata(audio.tags, 'tracknumber')
+    return ''
+
+
+def read_track_number(filepath):
+    return get_track_number(mutagen.File(filepath))
+
+
+def get_picture_from_flac(audio):
     for picture in audio.pictures:
         if picture.type == mutagen.id3.PictureType.COVER_FRONT:
-            return base64.b64encode(picture.data).decode()
+            return picture
+    return None
+
+
+def get_art(filepath, art):
+    '''
+    Read the raw cover art of filepath. art is where set_file found it
+    '''
+    if art is None:
+        return None
+    audio = mutagen.File(filepath)
+    if art == Audio.ART_APIC:
+        return audio.tags['APIC:'].data
+    elif art == Audio.ART_COVR:
+        return bytes(audio.tags['covr'][0])
+    elif art == Audio.ART_FLAC:
+        picture = get_picture_from_flac(audio)
+        if picture is not None:
+            return picture.data
+    elif art == Audio.ART_VORBIS:
+        value = get_data_from_metadata(audio.tags, 'metadata_block_picture')
+        if len(value) > 0:
+            return mutagen.flac.Picture(base64.b64decode(value)).data
     return None
 
 
@@ -62,18 +170,34 @@ class Audio(dict):
 
     GENRE_UNKNOWN = 0
 
+    ART_APIC = 'APIC:'
+    ART_COVR = 'covr'
+    ART_FLAC = 'flac'
+    ART_VORBIS = 'metadata_block_picture'
+
     def __init__(self, filepath):
         self.set_file(filepath)
 
     def set_file(self, filepath):
+        cached = metadata_cache.get(filepath)
+        # Entries cached before the track number was read are read again
+        if cached is not None and 'track' in cached.keys():
+            self.update(cached)
+            self['filepath'] = filepath
+            self['listened'] = False
+            self['position'] = 0
+            return
         self['filepath'] = filepath
         audio = mutagen.File(filepath)
-        self['hash'] = md5(filepath)
+        self['hash'] = file_id(filepath)
         self['title'] = os.path.splitext(os.path.basename(filepath))[0]
         self['artist'] = ''
         self['album'] = ''
         self['year'] = ''
+        self['track'] = ''
         self['length'] = 0
+        # Only where the cover art lives, the thumbnailer extracts it later
+        self['art'] = None
         print(type(audio.info))
         if type(audio.info) == mutagen.mp3.MPEGInfo:
             self['type'] = Audio.FORMAT_MP3
@@ -90,11 +214,7 @@ class Audio(dict):
                 else:
                     self['year'] = ''
                 if 'APIC:' in audio.tags.keys():
-                    thumbnail_base64 = base64.b64encode(
-                        audio.tags['APIC:'].data).decode()
-                else:
-                    thumbnail_base64 = None
-                create_thumbnail_for_audio(self['hash'], thumbnail_base64)
+                    self['art'] = Audio.ART_APIC
             if audio.info is not None:
                 self['length'] = audio.info.length
                 self['channels'] = audio.info.channels
@@ -109,9 +229,9 @@ class Audio(dict):
             self['artist'] = get_data_from_metadata(audio.tags, 'artist')
             self['album'] = get_data_from_metadata(audio.tags, 'album')
             self['year'] = get_data_from_metadata(audio.tags, 'year')
-            thumbnail_base64 = get_data_from_metadata(audio.tags,
-                                                      'metada_block_picture')
-            create_thumbnail_for_audio(self['hash'], thumbnail_base64)
+            if len(get_data_from_metadata(audio.tags,
+                                          'metadata_block_picture')) > 0:
+                self['art'] = Audio.ART_VORBIS
             self['length'] = audio.info.length
             self['channels'] = audio.info.channels
             self['sample rate'] = audio.info.sample_rate
@@ -128,8 +248,8 @@ class Audio(dict):
                 self['album'] = get_data_from_metadata(audio.tags,
                                                        'albumtitle')
             self['year'] = get_data_from_metadata(audio.tags, 'year')
-            thumbnail_base64 = get_image_from_flac(audio)
-            create_thumbnail_for_audio(self['hash'], thumbnail_base64)
+            if get_picture_from_flac(audio) is not None:
+                self['art'] = Audio.ART_FLAC
             self['length'] = audio.info.length
             self['channels'] = audio.info.channels
             self['sample rate'] = audio.info.sample_rate
@@ -168,16 +288,21 @@ class Audio(dict):
             self['bitrate'] = int(audio.info.bitrate / 1000.0)
             self['ext'] = 'm4a'
             if 'covr' in audio.tags.keys() and len(audio.tags['covr']) > 0:
-                thumbnail_base64 = base64.b64encode(
-                    audio.tags['covr'][0]).decode()
-            else:
-                thumbnail_base64 = None
-            create_thumbnail_for_audio(self['hash'], thumbnail_base64)
+                self['art'] = Audio.ART_COVR
+        self['track'] = get_track_number(audio)
         self['genre'] = Audio.GENRE_UNKNOWN
         self['listened'] = False
         self['position'] = 0
         if self['length'] == 0:
             raise Exception
+        metadata_cache.set(filepath, self.get_metadata())
+
+    def get_metadata(self):
+        '''
+        The part of the audio that only depends on the file
+        '''
+        return {key: value for key, value in self.items()
+                if key not in ('listened', 'position', 'content_hash')}
 
     def __eq__(self, other):
         return self['hash'] == other['hash']
@@ -217,5 +342,5 @@ if __name__ == '__main__':
     for afile in glob.glob('/home/lorenzo/Escritorio/*.m4a'):
         print('====', afile, '====')
         print(Audio(afile))
-        print(type(Audio(afile)['thumbnail_base64']))
+        print(Audio(afile)['art'])
     #print(Audio('/home/lorenzo/Descargas/AMemoryAway.ogg'))
@@ -52,8 +52,10 @@ PARAMS = {'first-time': True,
           'download_on_added': False,
           'remove_on_listened': False,
           'row': 0,
-          'audios': [],
-          'preset': 'none'
+          'verify_content': False,
+          'save_interval': 5,
+          'preset': 'none',
+          'collation_locale': None
           }
 
 
@@ -66,6 +68,11 @@ CONFIG_APP_DIR = os.path.join(CONFIG_DIR, APP)
 AUDIO_DIR = os.path.join(CONFIG_APP_DIR, 'audio')
 THUMBNAILS_DIR = os.path.join(CONFIG_APP_DIR, 'thumbnails')
 CONFIG_FILE = os.path.join(CONFIG_APP_DIR, APPCONF)
+METADATA_CACHE_FILE = os.path.join(CONFIG_APP_DIR, 'metadata.db')
+LIBRARY_FILE = os.path.join(CONFIG_APP_DIR, 'library.db')
+JOURNAL_FILE = os.path.join(CONFIG_APP_DIR, 'positions.journal')
+SNAPSHOT_FILE = os.path.join(CONFIG_APP_DIR, 'snapshot.bin')
+PRESETS_FILE = os.path.join(CONFIG_APP_DIR, 'presets.json')
 AUTOSTART_DIR = os.path.join(CONFIG_DIR, 'autostart')
 FILE_AUTO_START = os.path.join(AUTOSTART_DIR,
                                'lplayer-autostart.desktop')
@@ -24,18 +24,108 @@
 # SOFTWARE.
 
 
+import gi
+try:
+    gi.require_version('GObject', '2.0')
+except Exception as e:
+    print(e)
+    exit(-1)
+from gi.repository import GObject
 import codecs
+import copy
 import os
 import json
+from threading import Lock
 
 from . import comun
+from .persistence import WriteBehind
+from .persistence import write_atomically
 
 
-class Configuration(object):
+def _add_equalizer_bands(params):
+    '''
+    Configurations older than the Foobar2000 presets have less bands
+    '''
+    equalizer = params.get('equalizer')
+    if not isinstance(equalizer, dict):
+        return
+    for index in range(len(comun.PARAMS['equalizer'])):
+        equalizer.setdefault('band{0}'.format(index), 0)
+
+
+def _remove_null_values(params):
+    '''
+    The version is the only key that may be None
+    '''
+    for key in [key for key in params.keys()
+                if params[key] is None and key != 'version' and
+                key in comun.PARAMS.keys()]:
+        del params[key]
+
+
+# Step n upgrades a configuration from schema n to schema n + 1. Steps are
+# never edited once released, new ones go at the end
+MIGRATIONS = [_add_equalizer_bands,
+              _remove_null_values]
+SCHEMA = len(MIGRATIONS)
+
+
+def get_defaults():
+    params = copy.deepcopy(comun.PARAMS)
+    params['schema'] = SCHEMA
+    return params
+
+
+def migrate(params):
+    '''
+    Upgrade params in place to the current schema, keeping every value the
+    user has set and any key it does not know about. Returns True if
+    params has changed
+    '''
+    schema = params.get('schema', 0)
+    changed = schema < SCHEMA
+    for step in MIGRATIONS[schema:]:
+        step(params)
+    for key, value in comun.PARAMS.items():
+        if key not in params.keys():
+            params[key] = copy.deepcopy(value)
+            changed = True
+    params['schema'] = max(schema, SCHEMA)
+    return changed
+
+
+class Configuration(GObject.GObject):
+    '''
+    The configuration of lplayer. There is one for the whole process, use
+    Configuration.get_default() and connect to 'changed::<key>' to follow
+    a key
+    '''
+    __gsignals__ = {
+        'changed': (GObject.SIGNAL_RUN_FIRST | GObject.SIGNAL_DETAILED,
+                    GObject.TYPE_NONE, (str,)),
+    }
+    default = None
+
+    @staticmethod
+    def get_default():
+        if Configuration.default is None:
+            Configuration.default = Configuration()
+        return Configuration.default
+
     def __init__(self):
-        self.params = comun.PARAMS
+        GObject.GObject.__init__(self)
+        self.params = get_defaults()
+        # params is changed from the main thread and written from the
+        # writer thread
+        self.lock = Lock()
+        self.writer = WriteBehind(self.write)
         self.check()
         self.read()
+        self.writer.set_interval(self.get('save_interval'))
+        self.connect('changed::save_interval', self.on_save_interval_changed)
+
+    def on_save_interval_changed(self, configuration, key):
+        self.writer.set_interval(self.get(key))
 
     def check(self):
         if not os.path.exists(comun.CONFIG_APP_DIR):
@@ -46,20 +136,29 @@ class Configuration(object):
             return self.params[key]
         except KeyError as e:
             print(e)
-            self.params[key] = comun.PARAMS[key]
+            with self.lock:
+                self.params[key] = copy.deepcopy(comun.PARAMS[key])
             return self.params[key]
 
     def set(self, key, value):
-        self.params[key] = value
+        with self.lock:
+            changed = key not in self.params.keys() or\
+                self.params[key] != value
+            self.params[key] = value
+        self.writer.mark_dirty()
+        if changed:
+            self.emit('changed::' + key, key)
 
     def reset(self):
         if os.path.exists(comun.CONFIG_FILE):
             os.remove(comun.CONFIG_FILE)
-        self.params = comun.PARAMS
+        with self.lock:
+            self.params = get_defaults()
         self.save()
 
     def set_defaults(self):
-        self.params = comun.PARAMS
+        with self.lock:
+            self.params = get_defaults()
         self.save()
 
     def read(self):
@@ -68,20 +167,44 @@ class Configuration(object):
             f = codecs.open(comun.CONFIG_FILE, 'r', 'utf-8')
         except IOError as e:
             print(e)
-            self.save()
+            self.write()
             f = codecs.open(comun.CONFIG_FILE, 'r', 'utf-8')
         try:
-            self.params = json.loads(f.read())
+            params = json.loads(f.read())
+            changed = migrate(params)
+            with self.lock:
+                self.params = params
+            if changed:
+                self.write()
         except ValueError as e:
             print(e)
-            self.save()
+            self.write()
         f.close()
 
     def save(self):
+        '''
+        Schedule a write, the writer thread coalesces them
+        '''
+        self.writer.mark_dirty()
+
+    def flush(self):
+        '''
+        Write the pending changes now
+        '''
+        self.writer.flush()
+
+    def close(self):
+        self.writer.stop()
+
+    def write(self):
         self.check()
-        f = codecs.open(comun.CONFIG_FILE, 'w', 'utf-8')
-        f.write(json.dumps(self.params, indent=4, sort_keys=True))
-        f.close()
+        with self.lock:
+            params = copy.deepcopy(self.params)
+        write_atomically(comun.CONFIG_FILE,
+                         json.dumps(params, indent=4, sort_keys=True))
+
+    def get_flush_stats(self):
+        return self.writer.get_stats()
 
     def __str__(self):
         ans = ''
@@ -89,3 +212,36 @@ class Configuration(object):
             ans += '{0}: {1}\n'.format(key, self.params[key])
         return ans
 
+
+if __name__ == '__main__':
+    # Configurations as written by older releases
+    releases = {
+        '0.2.4': {'first-time': False, 'version': '0.2.4', 'speed': 1.5,
+                  'remove_silence': True, 'row': 3,
+                  'equalizer': {'band{0}'.format(i): 1 for i in range(10)},
+                  'audios': [{'hash': 'a'}, {'hash': 'b'}]},
+        '0.3.4': {'first-time': False, 'version': '0.3.4', 'speed': 1.0,
+                  'remove_silence': False, 'row': None, 'preset': 'rock',
+                  'equalizer': {'band{0}'.format(i): -2 for i in range(18)},
+                  'play_continuously': True, 'download_on_added': False,
+                  'remove_on_listened': False,
+                  'audios': [{'hash': 'c'}]},
+        '0.4.1': dict(copy.deepcopy(comun.PARAMS), version='0.4.1',
+                      audios=[]),
+    }
+    for version, params in releases.items():
+        original = copy.deepcopy(params)
+        assert migrate(params) is True, version
+        assert params['schema'] == SCHEMA, version
+        assert params['audios'] == original['audios'], version
+        assert set(params.keys()) >= set(comun.PARAMS.keys()), version
+        assert len(params['equalizer']) == len(comun.PARAMS['equalizer'])
+        for key, value in original.items():
+            if value is not None and key != 'equalizer':
+                assert params[key] == value, (version, key)
+        assert migrate(params) is False, version
+    assert releases['0.2.4']['equalizer']['band9'] == 1
+    assert releases['0.2.4']['equalizer']['band17'] == 0
+    assert releases['0.3.4']['row'] == 0
+    assert migrate(get_defaults()) is False
+    print('Migrated', ', '.join(sorted(releases.keys())), 'to schema', SCHEMA)
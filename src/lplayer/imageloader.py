@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gi
+try:
+    gi.require_version('GObject', '2.0')
+except Exception as e:
+    print(e)
+    exit(-1)
+from gi.repository import GObject
+from queue import PriorityQueue
+from threading import Lock
+from threading import Thread
+import itertools
+from .doitinbackground import IdleObject
+from .pixbufcache import pixbuf_cache
+from .pixbufcache import load_pixbuf
+
+WORKERS = 2
+
+
+class ImageLoader(IdleObject):
+    '''
+    Decode thumbnails in worker threads, the most visible first. The
+    pixbufs reach the cache from the main loop
+    '''
+    __gsignals__ = {
+        'image-loaded': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                         (str, int, int, object)),
+    }
+
+    def __init__(self, workers=WORKERS):
+        IdleObject.__init__(self)
+        self.queue = PriorityQueue()
+        self.lock = Lock()
+        # Requests by key, with the generation they were made in
+        self.pending = {}
+        self.generation = 0
+        self.counter = itertools.count()
+        self.connect('image-loaded', self.on_image_loaded)
+        for index in range(workers):
+            worker = Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+    def request(self, art_id, size, scale=1, priority=0):
+        '''
+        Queue the thumbnail unless it is already queued since the last
+        cancel. A lower priority is loaded before
+        '''
+        key = (art_id, size, scale)
+        with self.lock:
+            if self.pending.get(key) == self.generation:
+                return
+            self.pending[key] = self.generation
+            self.queue.put((priority, next(self.counter), self.generation,
+                            key))
+
+    def cancel(self):
+        '''
+        Forget the queued requests, the rows that are still visible ask
+        again when they are drawn
+        '''
+        with self.lock:
+            self.generation += 1
+            self.pending.clear()
+
+    def work(self):
+        while True:
+            priority, order, generation, key = self.queue.get()
+            with self.lock:
+                if self.pending.get(key) != generation:
+                    continue
+            pixbuf = load_pixbuf(*key)
+            self.emit('image-loaded', key[0], key[1], key[2], pixbuf)
+
+    def on_image_loaded(self, loader, art_id, size, scale, pixbuf):
+        key = (art_id, size, scale)
+        with self.lock:
+            self.pending.pop(key, None)
+        if pixbuf is None:
+            # Until the thumbnail is built, see Thumbnailer
+            pixbuf = pixbuf_cache.get_placeholder(size, scale)
+        pixbuf_cache.put(art_id, size, scale, pixbuf)
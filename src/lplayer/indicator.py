@@ -38,10 +38,10 @@ from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import GLib
 from gi.repository import GdkPixbuf
-import os
 import webbrowser
 from .comun import _
 from . import comun
+from .pixbufcache import pixbuf_cache
 PLAY = 'media-playback-start-symbolic'
 PAUSE = 'media-playback-pause-symbolic'
 
@@ -149,19 +149,10 @@ class Indicator(GObject.Object):
         else:
             self.emit('pause')
 
-    def set_current(self, label, hash=None):
+    def set_current(self, label, art_id=None):
         self.current.set_label(label)
-        pixbuf = None
-        if hash is not None:
-            filename = os.path.join(
-                comun.THUMBNAILS_DIR, '{0}.png'.format(hash))
-            if os.path.exists(filename):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    filename, 24, 24)
-        if pixbuf is None:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                comun.NOIMAGE_ICON, 24, 24)
-        self.current.set_image(Gtk.Image.new_from_pixbuf(pixbuf))
+        self.current.set_image(Gtk.Image.new_from_pixbuf(
+            pixbuf_cache.get(art_id, 24)))
 
 
     def get_help_menu(self):
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gi
+try:
+    gi.require_version('GObject', '2.0')
+    gi.require_version('GLib', '2.0')
+except Exception as e:
+    print(e)
+    exit(-1)
+from gi.repository import GObject
+from gi.repository import GLib
+from threading import Thread
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+from .doitinbackground import IdleObject
+from .audio import Audio
+
+
+def init_worker(path):
+    '''
+    Find the lplayer package like the launcher does
+    '''
+    sys.path[:] = path
+
+
+def load_audio(filename):
+    '''
+    Build the Audio for filename. Runs inside a worker process
+    '''
+    try:
+        return Audio(filename)
+    except Exception as e:
+        print(e)
+    return None
+
+
+class Ingester(IdleObject, Thread):
+    '''
+    Build Audio objects in a pool of processes and hand them, in the same
+    order as the filenames, to callback in the main loop
+    '''
+    __gsignals__ = {
+        'started': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, (int, )),
+        'ended': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, (bool,)),
+        'done_one': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                     (str,)),
+        'started_one': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                        (str,))
+    }
+
+    def __init__(self, callback, filenames, workers=None):
+        IdleObject.__init__(self)
+        Thread.__init__(self)
+        self.daemon = True
+        self.stopit = False
+        self.ok = True
+        self.callback = callback
+        self.filenames = filenames
+        self.first_audio = None
+        self.workers = workers if workers is not None else\
+            (os.cpu_count() or 1)
+        # Files in flight. Enough to keep every worker busy while the
+        # oldest result is being consumed
+        self.window = self.workers * 4
+
+    def stop(self, *args):
+        self.stopit = True
+
+    def run(self):
+        # filenames can be a generator still walking the directories
+        if hasattr(self.filenames, '__len__'):
+            self.emit('started', len(self.filenames))
+        else:
+            self.emit('started', 0)
+        filenames = iter(self.filenames)
+        # Forking this process, with GTK, GStreamer and their threads
+        # running, can deadlock the workers. They come from a clean server
+        context = multiprocessing.get_context('forkserver')
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=context,
+                                 initializer=init_worker,
+                                 initargs=(list(sys.path),)) as executor:
+            pending = deque()
+            for filename in filenames:
+                pending.append(
+                    (filename, executor.submit(load_audio, filename)))
+                if len(pending) >= self.window:
+                    break
+            while len(pending) > 0 and self.stopit is False:
+                filename, future = pending.popleft()
+                self.emit('started_one', filename)
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    print(e)
+                    self.ok = False
+                    audio = None
+                for next_filename in filenames:
+                    pending.append(
+                        (next_filename,
+                         executor.submit(load_audio, next_filename)))
+                    break
+                if audio is not None:
+                    if self.first_audio is None:
+                        self.first_audio = audio
+                    GLib.idle_add(self.callback, audio)
+                self.emit('done_one', filename)
+            for filename, future in pending:
+                future.cancel()
+        self.emit('ended', self.ok)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import sqlite3
+from threading import Lock
+from . import comun
+from .persistence import WriteBehind
+
+
+class LibraryStore(object):
+    '''
+    The tracks of the library, one row per track, in an SQLite database
+    '''
+    def __init__(self, filename=comun.LIBRARY_FILE, interval=5.0):
+        self.lock = Lock()
+        # Changes to existing tracks are coalesced, by hash
+        self.pending = {}
+        self.pending_lock = Lock()
+        self.writer = WriteBehind(self.write_pending, interval)
+        # Pending changes are written from the WriteBehind thread
+        self.connection = sqlite3.connect(filename, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            'hash TEXT PRIMARY KEY, sort_order INTEGER NOT NULL, '
+            'data TEXT NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS tracks_sort_order '
+            'ON tracks (sort_order)')
+
+    def load(self):
+        with self.lock:
+            return [json.loads(row[0]) for row in self.connection.execute(
+                'SELECT data FROM tracks ORDER BY sort_order')]
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM tracks').fetchone()[0]
+
+    def add(self, audio, order):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?)',
+                (audio['hash'], order, json.dumps(audio)))
+
+    def update(self, audio):
+        '''
+        Schedule the write of audio, only the last change of every track
+        reaches the database
+        '''
+        with self.pending_lock:
+            self.pending[audio['hash']] = dict(audio)
+        self.writer.mark_dirty()
+
+    def write_pending(self):
+        with self.pending_lock:
+            pending = self.pending
+            self.pending = {}
+        if len(pending) > 0:
+            self.update_many(pending.values())
+
+    def flush(self):
+        self.writer.flush()
+
+    def get_flush_stats(self):
+        return self.writer.get_stats()
+
+    def update_many(self, audios):
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'UPDATE tracks SET data=? WHERE hash=?',
+                [(json.dumps(audio), audio['hash']) for audio in audios])
+            self.connection.execute('COMMIT')
+
+    def remove(self, hashes):
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany('DELETE FROM tracks WHERE hash=?',
+                                        [(hash,) for hash in hashes])
+            self.connection.execute('COMMIT')
+
+    def reorder(self, audios):
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'UPDATE tracks SET sort_order=? WHERE hash=?',
+                [(order, audio['hash']) for order, audio in
+                 enumerate(audios)])
+            self.connection.execute('COMMIT')
+
+    def replace(self, audios):
+        '''
+        Store audios as the whole library
+        '''
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM tracks')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?)',
+                [(audio['hash'], order, json.dumps(audio))
+                 for order, audio in enumerate(audios)])
+            self.connection.execute('COMMIT')
+
+    def migrate(self, configuration):
+        '''
+        Move the library out of lplayer.conf, only once
+        '''
+        if 'audios' not in configuration.params.keys():
+            return
+        if self.count() == 0:
+            self.replace(configuration.params['audios'])
+        with configuration.lock:
+            del configuration.params['audios']
+        configuration.save()
+
+    def close(self):
+        self.writer.stop()
+        with self.lock:
+            self.connection.close()
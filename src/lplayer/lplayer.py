@@ -41,6 +41,7 @@ from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import GdkPixbuf
 from gi.repository import Notify
+import os
 import sys
 import webbrowser
 from .mainwindow import MainWindow
@@ -69,7 +70,12 @@ class MainApplication(Gtk.Application):
         if command_line is not None:
             print(command_line.get_arguments(), self.win)
             if len(command_line.get_arguments()) > 1:
-                self.new_tracks.extend(command_line.get_arguments()[1:])
+                # files and directories, relative to the caller's cwd.
+                # Directories are walked by the scanner while ingesting
+                cwd = command_line.get_cwd() or os.getcwd()
+                self.new_tracks.extend(
+                    [os.path.join(cwd, argument) for argument in
+                     command_line.get_arguments()[1:]])
         self.do_activate()
         return 0
 
@@ -229,7 +235,7 @@ class MainApplication(Gtk.Application):
         self.add_window(self.win)
         self.win.present()
         if len(self.new_tracks) > 0:
-            self.win.add_tracks_in_background(self.new_tracks)
+            self.win.add_files(self.new_tracks)
             self.new_tracks = []
 
     def action_clicked(self, action, variant):
@@ -31,7 +31,6 @@ try:
     gi.require_version('Gio', '2.0')
     gi.require_version('GLib', '2.0')
     gi.require_version('GObject', '2.0')
-    gi.require_version('GdkPixbuf', '2.0')
     gi.require_version('Notify', '0.7')
 except Exception as e:
     print(e)
@@ -41,12 +40,14 @@ from gi.repository import Gdk
 from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import GObject
-from gi.repository import GdkPixbuf
 from gi.repository import Notify
 import os
 import json
-import mimetypes
+import itertools
+import time
 import urllib.request
+from threading import Thread
+from queue import Queue
 from dbus.mainloop.glib import DBusGMainLoop
 from . import comun
 from .comun import _
@@ -54,23 +55,43 @@ from .sound_menu import SoundMenuControls
 from .player import Player
 from .player import Status
 from .configurator import Configuration
-from .listboxrowwithdata import ListBoxRowWithData
+from .librarystore import LibraryStore
+from .positionjournal import PositionJournal
+from .snapshot import read_snapshot
+from .snapshot import write_snapshot
+from .snapshot import remove_snapshot
+from .trackview import TrackView
 from .audio import Audio
+from .audio import migrate_hashes
+from .audio import content_hash
+from .audio import collision_id
+from .audio import read_track_number
 from .utils import get_thumbnail_filename_for_audio
-from .utils import get_pixbuf_from_base64string
 from .utils import get_desktop_environment
 from .showinfodialog import ShowInfoDialog
 from .preferencesdialog import PreferencesDialog
-from .doitinbackground import DoItInBackground
+from .ingester import Ingester
+from .scanner import scan
 from .progressdialog import ProgressDialog
 from .indicator import Indicator
-
-ALLOWED_MIMETYPES = ['application/x-ogg', 'application/ogg',
-                     'audio/x-vorbis+ogg', 'audio/x-scpls', 'audio/x-mp3',
-                     'audio/x-mpeg', 'audio/mpeg', 'audio/x-mpegurl',
-                     'audio/flac', 'audio/m4a', 'audio/x-m4a', 'audio/mp4',
-                     'audio/aac']
-mimetypes.add_type('audio/aac', '.aac')
+from .trackindex import TrackIndex
+from .searchindex import SearchIndex
+from .presets import load_presets
+from .sorting import SORTS
+from .sorting import prepare
+from .sorting import ensure_collation
+from .sorting import get_collation_locale
+from .sorting import sort_order
+from .thumbnailer import Thumbnailer
+from .pixbufcache import pixbuf_cache
+
+# Rows built before the window is shown, around the active one
+FIRST_SCREEN_ROWS = 50
+# Time to build rows on every iteration of the main loop, in seconds
+POPULATE_BUDGET = 0.004
+# Seconds from the window being created to its first frame, see
+# check_startup_metrics
+FIRST_FRAME_TARGET = 0.5
 DEFAULT_CURSOR = Gdk.Cursor(Gdk.CursorType.ARROW)
 WAIT_CURSOR = Gdk.Cursor(Gdk.CursorType.WATCH)
 
@@ -105,13 +126,6 @@ CSS = '''
 }''' % (additional_components)
 
 
-def get_index_audio(audios, hash):
-    for index, audio in enumerate(audios):
-        if audio['hash'] == hash:
-            return index
-    return -1
-
-
 def select_value_in_combo(combo, value):
     model = combo.get_model()
     for i, item in enumerate(model):
@@ -135,6 +149,8 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def __init__(self, app, files=[]):
         Gtk.ApplicationWindow.__init__(self, application=app)
+        self.metrics = {}
+        self.started = time.perf_counter()
         self.app = app
         self.set_icon_from_file(comun.ICON)
         self.set_size_request(500, 600)
@@ -145,15 +161,44 @@ class MainWindow(Gtk.ApplicationWindow):
         self.get_root_window().set_cursor(WAIT_CURSOR)
 
         self.active_row = None
+        self.next_row = None
         self.selected_row = None
         self.is_playing = False
         self.updater = None
-        self.configuration = Configuration()
+        self.index = TrackIndex()
+        self.search_index = SearchIndex()
+        self.thumbnailer = Thumbnailer()
+        self.thumbnailer.connect('thumbnail-ready', self.on_thumbnail_ready)
+        monitor = Gdk.Display.get_default().get_primary_monitor()
+        if monitor is not None:
+            self.thumbnailer.set_scale(monitor.get_scale_factor())
+        self.configuration = Configuration.get_default()
+        self.presets = load_presets()
+        self.library = LibraryStore(
+            interval=self.configuration.get('save_interval'))
+        self.library.migrate(self.configuration)
+        self.configuration.connect('changed::save_interval',
+                                   self.on_save_interval_changed)
         if self.configuration.get('version') is None or\
                 self.configuration.get('version') != comun.VERSION:
-            self.configuration.set_defaults()
+            # The configuration was migrated to the current schema on read
             self.configuration.set('version', comun.VERSION)
             self.configuration.set('first-time', False)
+        self.journal = PositionJournal()
+        self.deferred_updates = set()
+        self.pending_files = []
+        # New files whose sampled id is in the library, see check_collision
+        self.collisions = Queue()
+        self.collision_checker = None
+        # A clean quit leaves what the first screen needs in the snapshot,
+        # the library is loaded once the window is painted
+        self.audios = read_snapshot()
+        remove_snapshot()
+        self.library_loaded = self.audios is None
+        if self.library_loaded:
+            self.audios = self.load_library()
+            self.metrics['library_loaded'] = time.perf_counter() -\
+                self.started
         self.row = self.configuration.get('row')
 
         max_action = Gio.SimpleAction.new_stateful(
@@ -174,6 +219,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.player.connect('paused', self.on_player_paused)
         self.player.connect('stopped', self.on_player_stopped)
         self.player.connect('track-end', self.on_track_end)
+        self.player.connect('track-changed', self.on_track_changed)
 
         DBusGMainLoop(set_as_default=True)
         self.sound_menu = SoundMenuControls('lplayer')
@@ -200,6 +246,10 @@ class MainWindow(Gtk.ApplicationWindow):
         # Init Toolbar
         # self.init_toolbar()
         #
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text(_('Search'))
+        self.search_entry.connect('search-changed', self.on_search_changed)
+        vbox.pack_start(self.search_entry, False, False, 0)
         scrolledwindow = Gtk.ScrolledWindow()
         scrolledwindow.set_policy(Gtk.PolicyType.AUTOMATIC,
                                   Gtk.PolicyType.AUTOMATIC)
@@ -207,33 +257,28 @@ class MainWindow(Gtk.ApplicationWindow):
         scrolledwindow.set_visible(True)
         vbox.pack_start(scrolledwindow, True, True, 0)
 
-        self.trackview = Gtk.ListBox()
-        self.trackview.connect('row-activated', self.on_row_activated)
-        self.trackview.connect('row-selected', self.on_row_selected)
-        self.trackview.connect('selected-rows-changed',
-                               self.on_row_selected_changed)
-        self.trackview.set_activate_on_single_click(False)
-        self.trackview.connect('button-press-event', self.on_clicked)
-        self.trackview.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
+        self.trackview = TrackView()
+        self.trackview.connect('track-activated', self.on_row_activated)
+        self.trackview.connect('track-selected', self.on_row_selected)
+        self.trackview.connect('info-clicked', self.on_row_info)
+        self.trackview.connect('listened-clicked', self.on_row_listened)
+        self.trackview.connect('position-changed',
+                               self.on_row_position_changed)
+        self.trackview.connect('rows-added', self.on_rows_added)
         scrolledwindow.add(self.trackview)
 
-        for index, track in enumerate(self.configuration.get('audios')):
-            row = ListBoxRowWithData(track, index)
-            row.connect('button_info_clicked', self.on_row_info, row)
-            row.connect('button_listened_clicked', self.on_row_listened, row)
-            row.connect('position-changed', self.on_row_position_changed, row)
-            row.show()
-            row.set_active(False)
-            self.trackview.add(row)
+        self.populated = None
+        self.populate()
 
         self.get_root_window().set_cursor(DEFAULT_CURSOR)
 
-        row = self.trackview.get_row_at_index(0)
+        row = self.trackview.get_row_at_index(self.trackview.offset)
         self.trackview.handler_block_by_func(self.on_row_selected)
         self.trackview.select_row(row)
         self.trackview.handler_unblock_by_func(self.on_row_selected)
 
-        self.trackview.connect('drag-begin', self.drag_begin)
+        # Runs after the TreeView has set its own drag icon
+        self.trackview.connect_after('drag-begin', self.drag_begin)
         self.trackview.connect('drag-data-get', self.drag_data_get_data)
         self.trackview.connect('drag-drop', self.drag_drop)
         self.trackview.connect('drag-data-delete', self.drag_data_delete)
@@ -243,26 +288,25 @@ class MainWindow(Gtk.ApplicationWindow):
         dnd_list = [Gtk.TargetEntry.new('text/plain',
                                         Gtk.TargetFlags.SAME_WIDGET,
                                         1001)]
-        self.trackview.drag_source_set(Gdk.ModifierType.BUTTON1_MASK,
-                                       dnd_list,
-                                       Gdk.DragAction.MOVE)
+        self.trackview.enable_model_drag_source(Gdk.ModifierType.BUTTON1_MASK,
+                                                dnd_list,
+                                                Gdk.DragAction.MOVE)
         dnd_list = [Gtk.TargetEntry.new('text/plain',
                                         Gtk.TargetFlags.SAME_WIDGET,
                                         1001),
                     Gtk.TargetEntry.new('text/uri-list',
                                         Gtk.TargetFlags.OTHER_APP,
                                         0)]
-        self.trackview.drag_dest_set(Gtk.DestDefaults.MOTION |
-                                     Gtk.DestDefaults.HIGHLIGHT |
-                                     Gtk.DestDefaults.DROP,
-                                     dnd_list,
-                                     Gdk.DragAction.MOVE)
+        self.trackview.enable_model_drag_dest(dnd_list,
+                                              Gdk.DragAction.MOVE |
+                                              Gdk.DragAction.COPY)
 
         self.shorcuts()
         self.load_css()
         
         
         self.connect('realize', self.on_realize)
+        self.connect('draw', self.on_first_draw)
         self.show_all()
         self.play_controls.set_visible(True)
         self.play_controls.grab_focus()
@@ -270,22 +314,270 @@ class MainWindow(Gtk.ApplicationWindow):
         if self.configuration.get('preset') != 'none':
             select_value_in_combo(self.combobox_presets,
                                   self.configuration.get('preset'))
-        if len(self.trackview.get_children()) > 0:
-            if self.row > -1 and self.row < len(self.trackview.get_children()):
-                self.trackview.select_row(
-                    self.trackview.get_row_at_index(self.row))
-                self.set_active_row(self.trackview.get_row_at_index(self.row))
-            else:
-                self.trackview.select_row(self.trackview.get_row_at_index(0))
-                self.set_active_row(self.trackview.get_row_at_index(0))
+        if self.trackview.get_n_rows() > 0:
+            # Only the rows around self.row are built yet
+            row = self.trackview.get_row_at_index(self.row)
+            if row is None:
+                row = self.trackview.get_row_at_index(
+                    self.trackview.offset)
+            self.trackview.select_row(row)
+            self.set_active_row(row)
         self.control['play-pause'].grab_focus()
-        if len(files) > 0:
-            self.add_tracks_in_background(files)
+        if self.library_loaded:
+            self.build_search_index()
+            self.backfill_track_numbers()
+            if len(files) > 0:
+                self.add_tracks_in_background(files)
+            if self.configuration.get('verify_content') is True:
+                self.verify_tracks_in_background()
+        else:
+            self.pending_files = files
+
+    def add_row(self, track, prepend=False):
+        if prepend:
+            row = self.trackview.prepend_audio(track)
+        else:
+            row = self.trackview.add_audio(track)
+        self.index.add(track, row)
+        if self.library_loaded:
+            self.thumbnailer.request(track)
+
+    def populate(self):
+        '''
+        Build the rows around the active one now, so the window can be
+        painted, and the rest in short batches from the main loop
+        '''
+        for track in self.audios:
+            self.index.add(track)
+        if self.row > -1 and self.row < len(self.audios):
+            center = self.row
+        else:
+            center = 0
+        first = max(0, center - FIRST_SCREEN_ROWS // 2)
+        last = min(len(self.audios), first + FIRST_SCREEN_ROWS)
+        self.trackview.set_offset(first)
+        for track in self.audios[first:last]:
+            self.add_row(track)
+        self.populated = [first, last]
+        GLib.idle_add(self.populate_step)
+
+    def populate_step(self, budget=POPULATE_BUDGET):
+        if self.populated is None:
+            return False
+        deadline = time.perf_counter() + budget
+        first, last = self.populated
+        while first > 0 or last < len(self.audios):
+            # Tracks added meanwhile are appended to self.audios
+            if last < len(self.audios):
+                self.add_row(self.audios[last])
+                last += 1
+            if first > 0:
+                first -= 1
+                self.add_row(self.audios[first], prepend=True)
+            if time.perf_counter() > deadline:
+                self.populated = [first, last]
+                return True
+        self.populated = None
+        self.metrics['list_complete'] = time.perf_counter() - self.started
+        return False
+
+    def populate_all(self):
+        '''
+        Build the rows that are still missing, for what needs all of them
+        '''
+        if self.populated is not None:
+            self.populate_step(float('inf'))
+
+    def read_library(self):
+        audios = self.library.load()
+        if migrate_hashes(audios):
+            self.library.replace(audios)
+        return audios
+
+    def load_library(self):
+        audios = self.read_library()
+        self.replay_journal(audios, self.journal.replay())
+        return audios
+
+    def on_first_draw(self, widget, context):
+        self.disconnect_by_func(self.on_first_draw)
+        self.metrics['first_frame'] = time.perf_counter() - self.started
+        if self.library_loaded:
+            self.check_startup_metrics()
+        else:
+            reader = Thread(target=self.read_library_in_background)
+            reader.daemon = True
+            reader.start()
+
+    def read_library_in_background(self):
+        '''
+        Read the library and the journal from a thread, they are applied
+        from the main loop
+        '''
+        audios = self.read_library()
+        GLib.idle_add(self.load_library_lazily, audios, self.journal.replay())
+
+    def load_library_lazily(self, audios, states):
+        '''
+        Complete the tracks read from the snapshot with the library
+        '''
+        self.replay_journal(audios, states)
+        if [audio['hash'] for audio in audios] ==\
+                [audio['hash'] for audio in self.audios]:
+            for audio, full_audio in zip(self.audios, audios):
+                for key, value in full_audio.items():
+                    audio.setdefault(key, value)
+        else:
+            # The library has changed since the snapshot was written
+            print('Snapshot out of date')
+            self.populated = None
+            self.trackview.clear()
+            self.index.clear()
+            self.active_row = None
+            self.audios = audios
+            self.populate()
+            if self.row > -1 and self.row < len(self.audios):
+                self.set_active_row(self.trackview.get_row_at_index(self.row))
+        self.library_loaded = True
+        for hash in self.deferred_updates:
+            if hash in self.index:
+                self.update_audio_in_configuration(self.index.get_audio(hash))
+        self.deferred_updates.clear()
+        self.metrics['library_loaded'] = time.perf_counter() - self.started
+        # Every request stats a thumbnail, so they go in batches too
+        GLib.idle_add(self.request_thumbnails, iter(list(self.audios)))
+        self.build_search_index()
+        self.backfill_track_numbers()
+        if len(self.pending_files) > 0:
+            self.add_tracks_in_background(self.pending_files)
+            self.pending_files = []
+        if self.configuration.get('verify_content') is True:
+            self.verify_tracks_in_background()
+        self.check_startup_metrics()
+        return False
+
+    def request_thumbnails(self, tracks, budget=POPULATE_BUDGET):
+        deadline = time.perf_counter() + budget
+        for track in tracks:
+            if self.index.get_row(track['hash']) is not None:
+                self.thumbnailer.request(track)
+            if time.perf_counter() > deadline:
+                return True
+        return False
+
+    def get_startup_metrics(self):
+        '''
+        Seconds from the window being created to every startup milestone
+        '''
+        return dict(self.metrics)
+
+    def check_startup_metrics(self):
+        '''
+        Warn when the first frame is late. With LPLAYER_STARTUP_CHECK set,
+        lplayer quits once the library is loaded, with status 1 if it was
+        '''
+        late = self.metrics['first_frame'] > FIRST_FRAME_TARGET
+        if late:
+            print('First frame after {0:.3f} s, the target is {1} s'.format(
+                self.metrics['first_frame'], FIRST_FRAME_TARGET))
+        if os.environ.get('LPLAYER_STARTUP_CHECK') is not None:
+            print(self.get_startup_metrics())
+            exit(1 if late else 0)
+
+    def verify_tracks_in_background(self):
+        audios = [audio for audio in self.audios
+                  if 'content_hash' not in audio.keys()]
+        if len(audios) > 0:
+            self.verifier = Thread(target=self.verify_audios, args=(audios,))
+            self.verifier.daemon = True
+            self.verifier.start()
+
+    def backfill_track_numbers(self):
+        '''
+        Tracks added before the track number was read get it once, from a
+        thread, so albums sort in their order
+        '''
+        audios = [audio for audio in self.audios
+                  if 'track' not in audio.keys()]
+        if len(audios) > 0:
+            backfiller = Thread(target=self.read_track_numbers,
+                                args=(audios,))
+            backfiller.daemon = True
+            backfiller.start()
+
+    def read_track_numbers(self, audios):
+        for audio in audios:
+            try:
+                track = read_track_number(audio['filepath'])
+            except Exception as e:
+                print(e)
+                track = ''
+            GLib.idle_add(self.on_track_number_read, audio, track)
+
+    def on_track_number_read(self, audio, track):
+        audio['track'] = track
+        self.library.update(audio)
+        return False
+
+    def verify_audios(self, audios):
+        '''
+        Hash the whole content of audios, from a thread. The hashes are
+        stored from the main loop
+        '''
+        for audio in audios:
+            if os.path.exists(audio['filepath']):
+                try:
+                    GLib.idle_add(self.on_audio_verified, audio,
+                                  content_hash(audio['filepath']))
+                except Exception as e:
+                    print(e)
+
+    def check_collision(self, anaudio, existing):
+        '''
+        Compare the whole content of two files with the same sampled id,
+        from a thread. The ingest only reads the sampled blocks
+        '''
+        self.collisions.put((anaudio, existing['filepath'],
+                             existing.get('content_hash')))
+        if self.collision_checker is None:
+            self.collision_checker = Thread(target=self.check_collisions)
+            self.collision_checker.daemon = True
+            self.collision_checker.start()
+
+    def check_collisions(self):
+        while True:
+            anaudio, filepath, existing_hash = self.collisions.get()
+            try:
+                if existing_hash is None:
+                    existing_hash = content_hash(filepath)
+                new_hash = content_hash(anaudio['filepath'])
+            except Exception as e:
+                print(e)
+                continue
+            GLib.idle_add(self.on_collision_checked, anaudio, existing_hash,
+                          new_hash)
+
+    def on_collision_checked(self, anaudio, existing_hash, new_hash):
+        existing = self.index.get_audio(anaudio['hash'])
+        if existing is not None and 'content_hash' not in existing.keys():
+            self.on_audio_verified(existing, existing_hash)
+        anaudio['content_hash'] = new_hash
+        if new_hash != existing_hash:
+            # Same sampled blocks but a different file
+            anaudio['hash'] = collision_id(anaudio['hash'], new_hash)
+            self.add_audio(anaudio)
+        return False
+
+    def on_audio_verified(self, audio, hash):
+        audio['content_hash'] = hash
+        self.library.update(audio)
+        return False
 
     def shorcuts(self):
         self.create_shorcut_for_action('play-pause', '<Control>n')
         self.create_shorcut_for_action('next', '<Control>m')
         self.create_shorcut_for_action('previous', '<Control>b')
+        self.create_shorcut_for_action('search', '<Control>f')
 
     def create_shorcut_for_action(self, name, shorcut):
         action = Gio.SimpleAction.new(name, None)
@@ -303,6 +595,8 @@ class MainWindow(Gtk.ApplicationWindow):
             self._sound_menu_next()
         elif option == 'previous':
             self._sound_menu_previous()
+        elif option == 'search':
+            self.search_entry.grab_focus()
 
     def drag_drop(self, widget, context, selection, info, time):
         print('==== Drag drop ====')
@@ -321,9 +615,7 @@ class MainWindow(Gtk.ApplicationWindow):
         rows = self.trackview.get_selected_rows()
         if len(rows) > 0:
             selected = rows[0]
-            pixbuf = get_pixbuf_from_base64string(
-                selected.audio['thumbnail_base64']).scale_simple(
-                64, 64, GdkPixbuf.InterpType.BILINEAR)
+            pixbuf = pixbuf_cache.get(selected.audio.get('art_id'), 64)
             Gtk.drag_set_icon_pixbuf(context, pixbuf, -2, -2)
 
     def drag_data_get_data(self, treeview, context, selection, target_id,
@@ -344,90 +636,65 @@ class MainWindow(Gtk.ApplicationWindow):
     def drag_data_received(self, widget, drag_context, x, y, selection_data,
                            info, timestamp):
         print('==== Drag received data ====')
+        # The TreeView would otherwise handle the drop as its own rows
+        widget.stop_emission_by_name('drag-data-received')
         if info == 1001:
-            row_after = self.trackview.get_row_at_y(y)
-            print(row_after.audio['title'])
-            rows = json.loads(selection_data.get_text())
-            rows_to_move = []
-            for row in rows:
-                rows_to_move.append(self.trackview.get_row_at_index(row))
-            for row_to_move in rows_to_move:
-                print(row_to_move.audio['title'])
-                self.trackview.remove(row_to_move)
-            index_row_after = self.get_index_for_audio(row_after.audio)
-            for index, row_to_move in enumerate(rows_to_move):
-                print(index_row_after, index)
-                new_row = ListBoxRowWithData(row_to_move.audio,
-                                             index_row_after + index)
-                new_row.connect('button_info_clicked',
-                                self.on_row_info, new_row)
-                new_row.connect('button_listened_clicked',
-                                self.on_row_listened,
-                                new_row)
-                self.trackview.insert(new_row,
-                                      index_row_after + index)
-            self.trackview.show_all()
+            # Indexes are absolute, every row has to be built
+            self.populate_all()
+            destination = self.trackview.get_dest_row_at_pos(x, y)
+            if destination is None:
+                index = self.trackview.get_n_rows()
+            else:
+                path, position = destination
+                index = self.trackview.get_index_for_path(path)
+                if position in (Gtk.TreeViewDropPosition.AFTER,
+                                Gtk.TreeViewDropPosition.INTO_OR_AFTER):
+                    index += 1
+            rows = [self.trackview.get_row_at_index(row)
+                    for row in json.loads(selection_data.get_text())]
+            self.trackview.move_rows(rows, index)
             self.update_audios()
+            drag_context.finish(True, False, timestamp)
         else:
-            print('aqui')
             filenames = selection_data.get_uris()
             print(filenames)
-            tracks_to_add = []
+            paths = []
             for filename in filenames:
                 if len(filename) > 8:
                     filename = urllib.request.url2pathname(filename)
                     filename = filename[7:]
                     if os.path.exists(filename):
-                        if os.path.isdir(filename):
-                            print('Is directory')
-                            for afile_in_directory in os.listdir(filename):
-                                new_file = os.path.join(filename,
-                                                        afile_in_directory)
-                                if os.path.isfile(new_file):
-                                    mime = mimetypes.guess_type(new_file)[0]
-                                    if mime in ALLOWED_MIMETYPES:
-                                        tracks_to_add.append(new_file)
-                        else:
-                            mime = mimetypes.guess_type(filename)[0]
-                            print('===============')
-                            print(mime)
-                            print('===============')
-                            if mime in ALLOWED_MIMETYPES:
-                                tracks_to_add.append(filename)
-            if len(tracks_to_add) > 0:
-                print(tracks_to_add)
-                self.add_tracks_in_background(tracks_to_add)
+                        paths.append(filename)
+            drag_context.finish(len(paths) > 0, False, timestamp)
+            if len(paths) > 0:
+                self.add_files(paths)
                 return True
         return False
 
-    def on_clicked(self, widget, event):
-        print('clicked')
-        if event.button == 1 and\
-                event.type == Gdk.EventType.DOUBLE_BUTTON_PRESS:
-            if self.selected_row is not None:
-                self.play_row(self.selected_row)
-        if event.get_state() & Gdk.ModifierType.SHIFT_MASK or\
-                event.get_state() & Gdk.ModifierType.CONTROL_MASK:
-            pass
-        else:
-            self.trackview.unselect_all()
-        self.trackview.select_row(self.trackview.get_row_at_y(event.y))
-
     def delete_event(self, widget, arg):
         self.hide()
         self.indicator.main_window_is_hidden()
         return True
 
     def on_close(self, widget):
-        self.configuration.save()
+        self.close_library()
+
+    def close_library(self):
+        self.compact_journal()
+        self.journal.close()
+        self.thumbnailer.shutdown()
+        write_snapshot(self.audios)
+        self.configuration.close()
+        self.library.close()
+
+    def on_save_interval_changed(self, configuration, key):
+        self.library.writer.set_interval(configuration.get(key))
 
     def on_preferences_clicked(self, widget):
-        self.configuration.save()
         cm = PreferencesDialog(self)
         if cm.run() == Gtk.ResponseType.ACCEPT:
             cm.hide()
             cm.save_preferences()
-            self.configuration.read()
         cm.destroy()
 
     def on_maximize_toggle(self, action, value):
@@ -449,26 +716,33 @@ class MainWindow(Gtk.ApplicationWindow):
         sid.destroy()
 
     def get_number_of_tracks(self):
-        return len(self.trackview.get_children())
+        self.populate_all()
+        return self.trackview.get_n_rows()
+
+    def get_row_at_index(self, index):
+        '''
+        The row at the absolute index, built now if it is still missing
+        '''
+        row = self.trackview.get_row_at_index(index)
+        if row is None and self.populated is not None:
+            self.populate_all()
+            row = self.trackview.get_row_at_index(index)
+        return row
 
     def play_row_by_index(self, index):
-        print('====', index, '====')
-        if index >= 0 and index < len(self.trackview.get_children()):
-            self.play_row(self.trackview.get_row_at_index(index))
+        row = self.get_row_at_index(index)
+        if row is not None:
+            self.play_row(row)
 
     def play_row_by_audio(self, audio):
-        found_row = None
-        for index, row in enumerate(self.trackview.get_children()):
-            if row.audio == audio:
-                found_row = row
-                break
+        found_row = self.index.get_row(audio['hash'])
         if found_row is not None:
             self.play_row(found_row)
 
     def get_index_for_audio(self, audio):
-        for row in self.trackview.get_children():
-            if row.audio == audio:
-                return row.index
+        row = self.index.get_row(audio['hash'])
+        if row is not None:
+            return row.index
         return -1
 
     def play_row(self, row):
@@ -477,10 +751,8 @@ class MainWindow(Gtk.ApplicationWindow):
         if row.audio is None or not os.path.exists(row.audio['filepath']):
             self.remove_rows([row])
             return
-        if len(self.trackview.get_children()) > 0:
-            self.trackview.get_adjustment().set_value(
-                row.get_index() * row.get_allocated_height())
-            row.grab_focus()
+        if self.trackview.get_n_rows() > 0:
+            self.trackview.scroll_to_row(row)
             if self.active_row is not None and self.active_row == row:
                 if self.is_playing:
                     self.player.pause()
@@ -514,26 +786,7 @@ class MainWindow(Gtk.ApplicationWindow):
                         self.player.set_position(
                             self.active_row.audio['position'] *
                             float(self.active_row.audio['length']))
-                    artists = [self.active_row.audio['artist']]
-                    album = self.active_row.audio['album']
-                    title = self.active_row.audio['title']
-                    album_art = 'file://' + get_thumbnail_filename_for_audio(
-                        self.active_row.audio)
-                    self.sound_menu.song_changed(artists, album,
-                                                 title,
-                                                 album_art)
-                    self.sound_menu.signal_playing()
-
-                    print(type(album), type(title), type(album_art))
-                    self.notification.update('{0} - {1}'.format(
-                        'lplayer',
-                        album),
-                        title,
-                        album_art)
-                    try:
-                        self.notification.show()
-                    except Exception as e:
-                        print(e)
+                    self.announce_track()
 
                     if self.active_row.audio['position'] > 0 and\
                             self.active_row.audio['position'] <= 1:
@@ -578,23 +831,7 @@ class MainWindow(Gtk.ApplicationWindow):
                     self.player.set_position(
                         self.active_row.audio['position'] *
                         float(self.active_row.audio['length']))
-                artists = [self.active_row.audio['artist']]
-                album = self.active_row.audio['album']
-                title = self.active_row.audio['title']
-                album_art = 'file://' + get_thumbnail_filename_for_audio(
-                    self.active_row.audio)
-                self.sound_menu.song_changed(artists, album, title, album_art)
-                self.sound_menu.signal_playing()
-
-                self.notification.update('{0} - {1}'.format(
-                    'lplayer',
-                    album),
-                    title,
-                    album_art)
-                try:
-                    self.notification.show()
-                except Exception as e:
-                    print(e)
+                self.announce_track()
 
                 if self.active_row.audio['position'] > 0 and\
                         self.active_row.audio['position'] <= 1:
@@ -612,13 +849,45 @@ class MainWindow(Gtk.ApplicationWindow):
                 self.is_playing = True
 
     def update_audios(self):
-        audios = self.configuration.get('audios')
-        for row in self.trackview.get_children():
-            for index, audio in enumerate(audios):
-                if row.audio == audio:
-                    audios[index] = audio
-                    self.configuration.set('audios', audios)
-                    break
+        # The library follows the order of the rows
+        self.populate_all()
+        audios = [row.audio for row in self.trackview.get_children()]
+        self.audios = audios
+        self.library.reorder(audios)
+        if self.active_row is not None:
+            self.row = self.active_row.index
+        self.queue_next_track()
+
+    def on_sort_changed(self, widget):
+        tree_iter = widget.get_active_iter()
+        if tree_iter is not None:
+            order = widget.get_model()[tree_iter][1]
+            if order in SORTS:
+                self.sort_tracks(order)
+                widget.set_active(0)
+
+    def sort_tracks(self, order):
+        '''
+        Sort the tracks comparing the collation keys stored with them, the
+        rows are put in the new order with a single reorder of the model
+        '''
+        if not self.library_loaded:
+            # The snapshot tracks lack the tags to sort by
+            return
+        self.populate_all()
+        self.trackview.flush()
+        audios = [row.audio for row in self.trackview.get_children()]
+        collation_locale = get_collation_locale()
+        renew = self.configuration.get('collation_locale') != collation_locale
+        changed = ensure_collation(audios, renew)
+        if len(changed) > 0:
+            self.library.update_many(changed)
+        if renew:
+            self.configuration.set('collation_locale', collation_locale)
+        self.trackview.reorder(sort_order(audios, order))
+        self.update_audios()
+        if self.active_row is not None:
+            self.trackview.scroll_to_row(self.active_row)
 
     def _sound_menu_quit(self):
         """Quit"""
@@ -629,7 +898,7 @@ class MainWindow(Gtk.ApplicationWindow):
                 print(e)
         self.update_audios()
         self.configuration.set('row', self.row)
-        self.configuration.save()
+        self.close_library()
         exit(0)
 
     def _sound_menu_raise(self):
@@ -643,7 +912,7 @@ class MainWindow(Gtk.ApplicationWindow):
         """Play"""
         # self.is_playing = True  # Need to overwrite
         if self.active_row is None:
-            self.set_active_row(self.trackview.get_row_at_index(0))
+            self.set_active_row(self.get_row_at_index(0))
         self.play_row(self.active_row)
 
     def _sound_menu_stop(self):
@@ -658,39 +927,130 @@ class MainWindow(Gtk.ApplicationWindow):
         if self.active_row is not None:
             self.play_row(self.active_row)
 
-    def _sound_menu_next(self, *args):
-        """Next"""
+    def announce_track(self):
+        artists = [self.active_row.audio['artist']]
+        album = self.active_row.audio['album']
+        title = self.active_row.audio['title']
+        album_art = 'file://' + get_thumbnail_filename_for_audio(
+            self.active_row.audio)
+        self.sound_menu.song_changed(artists, album, title, album_art)
+        self.sound_menu.signal_playing()
+
+        self.notification.update('{0} - {1}'.format(
+            'lplayer',
+            album),
+            title,
+            album_art)
+        try:
+            self.notification.show()
+        except Exception as e:
+            print(e)
+
+    def get_next_row(self):
+        row = None
         if self.active_row is not None:
-            next = self.active_row.index + 1
-            if next >= len(self.trackview.get_children()):
-                next = 0
+            row = self.get_row_at_index(self.active_row.index + 1)
+        if row is None:
+            row = self.get_row_at_index(0)
+        return row
+
+    def queue_next_track(self):
+        '''
+        Tell the player what follows the active row, it is prerolled
+        before the end of the current track so there is no gap
+        '''
+        next_row = None
+        if self.configuration.get('play_continuously') is True and\
+                self.active_row is not None:
+            next_row = self.get_next_row()
+            if next_row is self.active_row or next_row is None or\
+                    not os.path.exists(next_row.audio['filepath']):
+                next_row = None
+        self.next_row = next_row
+        if next_row is not None:
+            self.player.set_next_filename(next_row.audio['filepath'])
         else:
-            next = 0
-        self.play_row(self.trackview.get_row_at_index(next))
+            self.player.set_next_filename(None)
+
+    def _sound_menu_next(self, *args):
+        """Next"""
+        self.play_row(self.get_next_row())
 
     def _sound_menu_previous(self, *args):
         """Previous"""
-        if self.active_row is not None:
-            previous = self.active_row.index - 1
-            if previous < 0:
-                previous = len(self.trackview.get_children()) - 1
-        else:
-            previous = len(self.trackview.get_children()) - 1
-        self.play_row(self.trackview.get_row_at_index(previous))
+        row = None
+        if self.active_row is not None and self.active_row.index > 0:
+            row = self.get_row_at_index(self.active_row.index - 1)
+        if row is None:
+            row = self.get_row_at_index(self.get_number_of_tracks() - 1)
+        self.play_row(row)
+
+    def on_thumbnail_ready(self, thumbnailer, hash, art_id):
+        audio = self.index.get_audio(hash)
+        if audio is not None:
+            audio['art_id'] = art_id or None
+            if audio['art_id'] is not None:
+                pixbuf_cache.invalidate(audio['art_id'])
+            self.library.update(audio)
+        row = self.index.get_row(hash)
+        if row is not None:
+            row.set_thumbnail()
+            if self.selected_row is row:
+                self.indicator.set_current(row.audio['title'],
+                                           row.audio['art_id'])
 
     def on_row_selected(self, widget, row):
         if row is not None:
             print('row selected', row.audio['title'])
-            self.indicator.set_current(row.audio['title'], row.audio['hash'])
+            self.indicator.set_current(row.audio['title'],
+                                       row.audio.get('art_id'))
         self.selected_row = row
 
     def update_audio_in_configuration(self, audio):
-        audios = self.configuration.get('audios')
-        for index, anaudio in enumerate(audios):
-            if audio == anaudio:
-                audios[index] = audio
-                self.configuration.set('audios', audios)
-                break
+        # The journal is replayed over the library after a crash, so it
+        # must have the last state, not only the last playing tick
+        self.journal_state(audio)
+        if not self.library_loaded:
+            # Only the snapshot is loaded, the library would lose the rest
+            self.deferred_updates.add(audio['hash'])
+            return
+        anaudio = self.index.get_audio(audio['hash'])
+        if anaudio is not None:
+            if anaudio is not audio:
+                anaudio.update(audio)
+            self.library.update(anaudio)
+
+    def replay_journal(self, audios, states):
+        '''
+        Recover the positions the library missed when lplayer crashed,
+        states is what the journal has
+        '''
+        changed = []
+        for audio in audios:
+            if audio['hash'] in states:
+                position, listened, timestamp = states[audio['hash']]
+                audio['position'] = position
+                audio['listened'] = listened
+                changed.append(audio)
+        if len(changed) > 0:
+            self.library.update_many(changed)
+        self.journal.truncate()
+
+    def journal_state(self, audio):
+        self.journal.append(audio['hash'], audio['position'],
+                            audio['listened'])
+        if self.journal.needs_compaction():
+            self.compact_journal()
+
+    def compact_journal(self):
+        if not self.library_loaded:
+            return
+        for hash in self.journal.replay().keys():
+            audio = self.index.get_audio(hash)
+            if audio is not None:
+                self.library.update(audio)
+        self.library.flush()
+        self.journal.truncate()
 
     def update_position(self):
         if self.active_row is not None:
@@ -722,7 +1082,7 @@ class MainWindow(Gtk.ApplicationWindow):
                     if self.configuration.get('play_continuously') is True:
                         self._sound_menu_next()
                     '''
-                self.update_audio_in_configuration(self.active_row.audio)
+                self.journal_state(self.active_row.audio)
             if self.player.status != Status.PLAYING:
                 self.updater = 0
             return self.player.status == Status.PLAYING
@@ -732,6 +1092,8 @@ class MainWindow(Gtk.ApplicationWindow):
     def on_track_end(self, widget):
         self.active_row.set_listened(True)
         self.active_row.set_position(0)
+        # Stored before the next track becomes the active one
+        self.update_audio_in_configuration(self.active_row.audio)
         if self.is_playing is True:
             self.player.pause()
             self.control['play-pause'].get_child().set_from_gicon(
@@ -742,10 +1104,45 @@ class MainWindow(Gtk.ApplicationWindow):
             self.is_playing = False
         if self.configuration.get('play_continuously') is True:
             self._sound_menu_next()
-        self.update_audio_in_configuration(self.active_row.audio)
+
+    def on_track_changed(self, player):
+        '''
+        The player went on to the queued track without stopping
+        '''
+        row = self.next_row
+        self.next_row = None
+        if self.active_row is not None:
+            self.active_row.set_listened(True)
+            self.active_row.set_position(0)
+            self.update_audio_in_configuration(self.active_row.audio)
+        if row is None or self.index.get_row(row.audio['hash']) is not row:
+            # The queued row was removed meanwhile
+            self.player.stop()
+            self.control['play-pause'].get_child().set_from_gicon(
+                Gio.ThemedIcon(name='media-playback-start-symbolic'),
+                Gtk.IconSize.BUTTON)
+            self.control['play-pause'].set_tooltip_text(_('Play'))
+            self.is_playing = False
+            return
+        self.set_active_row(row)
+        self.trackview.scroll_to_row(row)
+        fraction = float(row.get_position())
+        self.control['position'].handler_block_by_func(
+            self.on_position_button_changed)
+        self.control['position'].set_value(fraction)
+        self.control['label-position'].set_text(
+            _('Position') + ': {0}%'.format(int(fraction * 100)))
+        self.control['position'].handler_unblock_by_func(
+            self.on_position_button_changed)
+        self.announce_track()
+        if row.audio['position'] > 0 and row.audio['position'] < 1:
+            self.player.set_position(row.audio['position'] *
+                                     float(row.audio['length']))
+        self.queue_next_track()
 
     def on_player_started(self, player, position):
         self.indicator.play()
+        self.queue_next_track()
 
     def on_player_paused(self, player, position):
         self.indicator.pause()
@@ -753,15 +1150,12 @@ class MainWindow(Gtk.ApplicationWindow):
     def on_player_stopped(self, player, position):
         self.indicator.pause()
 
-    def on_row_selected_changed(self, widget):
-        print(widget)
-        pass
-
     def on_row_activated(self, widget, row):
-        pass
+        self.play_row(row)
 
     def on_play_continuously_changed(self, widget, value):
         self.configuration.set('play_continuously', widget.get_active())
+        self.queue_next_track()
 
     def on_remove_silence_changed(self, widget, value):
         self.player.set_remove_silence(widget.get_active())
@@ -904,25 +1298,8 @@ class MainWindow(Gtk.ApplicationWindow):
         equalizer_grid.show_all()
 
         presets = Gtk.ListStore(str, str)
-        presets.append([_('None'), 'none'])
-        presets.append([_('Classical'), 'classical'])
-        presets.append([_('Club'), 'club'])
-        presets.append([_('Dance'), 'dance'])
-        presets.append([_('Flat'), 'flat'])
-        presets.append([_('Live'), 'live'])
-        presets.append([_('Headphone'), 'headphone'])
-        presets.append([_('Rock'), 'rock'])
-        presets.append([_('Pop'), 'pop'])
-        presets.append([_('Full Bass and Treble'), 'full-bass-and-treble'])
-        presets.append([_('Full Bass'), 'full-bass'])
-        presets.append([_('Full Treble'), 'full-treble'])
-        presets.append([_('Soft'), 'soft'])
-        presets.append([_('Party'), 'party'])
-        presets.append([_('Ska'), 'ska'])
-        presets.append([_('Soft Rock'), 'soft-rock'])
-        presets.append([_('Large Hall'), 'large-hall'])
-        presets.append([_('Reggae'), 'reggae'])
-        presets.append([_('Techno'), 'techno'])
+        for id, (name, gains) in self.presets.items():
+            presets.append([name, id])
 
         self.combobox_presets = Gtk.ComboBox.new()
         self.combobox_presets.set_tooltip_text(_('Equalizer presets'))
@@ -934,6 +1311,26 @@ class MainWindow(Gtk.ApplicationWindow):
         self.combobox_presets.connect('changed', self.on_preset_changed)
         popover_grid.attach(self.combobox_presets, 0, 6, 10, 1)
 
+        sorts = Gtk.ListStore(str, str)
+        sorts.append([_('Sort by'), 'none'])
+        sorts.append([_('Artist'), 'artist'])
+        sorts.append([_('Album'), 'album'])
+        sorts.append([_('Title'), 'title'])
+        sorts.append([_('Year'), 'year'])
+        sorts.append([_('Duration'), 'duration'])
+        sorts.append([_('Listened'), 'listened'])
+        sorts.append([_('Date added'), 'added'])
+
+        self.combobox_sort = Gtk.ComboBox.new()
+        self.combobox_sort.set_tooltip_text(_('Sort the tracks'))
+        self.combobox_sort.set_model(sorts)
+        cell2 = Gtk.CellRendererText()
+        self.combobox_sort.pack_start(cell2, True)
+        self.combobox_sort.add_attribute(cell2, 'text', 0)
+        self.combobox_sort.set_active(0)
+        self.combobox_sort.connect('changed', self.on_sort_changed)
+        popover_grid.attach(self.combobox_sort, 0, 7, 10, 1)
+
         popover_grid.show_all()
 
         self.control['configuration'] = Gtk.MenuButton()
@@ -1028,69 +1425,25 @@ class MainWindow(Gtk.ApplicationWindow):
         hb.pack_end(self.control['add'])
 
     def on_preset_changed(self, widget):
-        print('changed')
         preset = get_selected_value_in_combo(widget)
         self.configuration.set('preset', preset)
-        values = []
-        # presets https://gist.github.com/kra3/9781800
-        if preset == 'none':
-            values = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        elif preset == 'classical':
-            values = [0.375, 0.375, 0.375, 0.375, 0.375, 0.375, -4.5, -4.5,
-                      -4.5, -6.0]
-        elif preset == 'club':
-            values = [0.375, 0.375, 2.25, 3.75, 3.75, 3.75, 2.25, 0.375,
-                      0.375, 0.375]
-        elif preset == 'dance':
-            values = [6, 4.5, 1.5, 0, 0, -3.75, -4.5, -4.5,
-                      0, 0]
-        elif preset == 'flat':
-            values = [0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375,
-                      0.375, 0.375]
-        elif preset == 'live':
-            values = [-3, 0.375, 2.625, 3.375, 3.75, 3.75, 2.625, 1.875, 1.875,
-                      1.5]
-        elif preset == 'headphone':
-            values = [3, 6.75, 3.375, -2.25, -1.5, 1.125, 3, 6, 7.875, 9]
-        elif preset == 'rock':
-            values = [4.875, 3, -3.375, -4.875, -2.25, 2.625, 5.625, 6.75,
-                      6.75, 6.75]
-        elif preset == 'pop':
-            values = [-1.125, 3, 4.5, 4.875, 3.375, -0.75, -1.5, -1.5, -1.125,
-                      -1.125]
-        elif preset == 'full-bass-and-treble':
-            values = [4.5, 3.75, 0.375, -4.5, -3, 1.125, 5.25, 6.75, 7.5, 7.5]
-        elif preset == 'full-bass':
-            values = [6, 6, 6, 3.75, 1.125, -2.625, -5.25, -6.375, -6.75,
-                      -6.75]
-        elif preset == 'full-treble':
-            values = [-6, -6, -6, -2.625, 1.875, 6.75, 9.75, 9.75, 9.75, 10.5]
-        elif preset == 'soft':
-            values = [3, 1.125, -0.75, -1.5, -0.75, 2.625, 5.25, 6, 6.75, 7.5]
-        elif preset == 'party':
-            values = [4.5, 4.5, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 4.5,
-                      4.5]
-        elif preset == 'ska':
-            values = [-1.5, -3, -2.625, -0.375, 2.625, 3.75, 5.625, 6, 6.75, 6]
-        elif preset == 'soft-rock':
-            values = [2.625, 2.625, 1.5, -0.375, -2.625, -3.375, -2.25, -0.375,
-                      1.875, 5.625]
-        elif preset == 'large-hall':
-            values = [6.375, 6.375, 3.75, 3.75, 0.375, -3, -3, -3, 0.375,
-                      0.375]
-        elif preset == 'reggae':
-            values = [0.375, 0.375, -0.375, -3.75, 0.375, 4.125, 4.125, 0.375,
-                      0.375, 0.375]
-        elif preset == 'techno':
-            values = [4.875, 3.75, 0.375, -3.375, -3, 0.375, 4.875, 6, 6,
-                      5.625]
-        if len(values) > 0:
-            for index in range(0, 10):
-                band = 'band{0}'.format(index)
-                self.control[band].set_value(values[index])
+        if preset not in self.presets.keys():
+            return
+        name, gains = self.presets[preset]
+        equalizer = dict(self.configuration.get('equalizer'))
+        for index, gain in enumerate(gains):
+            band = 'band{0}'.format(index)
+            equalizer[band] = gain
+            # The whole preset goes to the player below, in one go
+            self.control[band].handler_block_by_func(self.on_band_changed)
+            self.control[band].set_value(gain)
+            self.control[band].handler_unblock_by_func(self.on_band_changed)
+        self.configuration.set('equalizer', equalizer)
+        self.player.set_equalizer_gains(gains)
 
     def on_band_changed(self, widget, band):
-        equalizer = self.configuration.get('equalizer')
+        # A copy, set() only signals a value that differs from the stored one
+        equalizer = dict(self.configuration.get('equalizer'))
         equalizer[band] = widget.get_value()
         self.configuration.set('equalizer', equalizer)
         self.player.set_equalizer_by_band(int(band[4:]), widget.get_value())
@@ -1156,7 +1509,7 @@ class MainWindow(Gtk.ApplicationWindow):
             filenames = dialog.get_filenames()
             GLib.idle_add(dialog.destroy)
             # self.add_tracks_sync(filenames)
-            self.add_tracks_in_background(filenames)
+            self.add_files(filenames)
         else:
             dialog.destroy()
 
@@ -1179,64 +1532,110 @@ class MainWindow(Gtk.ApplicationWindow):
                 dialog.destroy()
 
     def remove_rows(self, rows):
-        audios = self.configuration.get('audios')
+        self.populate_all()
+        hashes = set([row.audio['hash'] for row in rows])
+        audios = [audio for audio in self.audios
+                  if audio['hash'] not in hashes]
+        # Artwork is shared, only remove what no other track uses
+        art_ids = set([audio.get('art_id') for audio in audios])
+        self.trackview.queue_remove(rows)
+        self.trackview.flush()
         for row in rows:
-            audios.remove(row.audio)
-            self.trackview.remove(row)
-            audio_id = row.audio['hash']
-            file_thumbnail = os.path.join(
-                comun.THUMBNAILS_DIR,
-                '{0}.{1}'.format(audio_id, 'png'))
-            if os.path.exists(file_thumbnail):
-                os.remove(file_thumbnail)
-        self.configuration.set('audios', audios)
-        self.trackview.show_all()
-        if self.active_row.audio == row.audio and\
-                len(self.trackview.get_children()) > 0:
-            self.set_active_row(self.trackview.get_row_at_index(0))
+            self.index.remove(row.audio['hash'])
+            self.search_index.remove(row.audio['hash'])
+        self.thumbnailer.purge(set([row.audio.get('art_id') for row in rows
+                                    if row.audio.get('art_id') is not None and
+                                    row.audio['art_id'] not in art_ids]))
+        self.audios = audios
+        self.library.remove(hashes)
+        if self.active_row is not None and\
+                self.active_row.audio['hash'] in hashes:
+            self.active_row = None
+            if self.trackview.get_n_rows() > 0:
+                self.set_active_row(self.trackview.get_row_at_index(
+                    self.trackview.offset))
+        self.queue_next_track()
 
     def set_active_row(self, row=None):
-        if len(self.trackview.get_children()) > 0:
+        if row is not None and self.trackview.get_n_rows() > 0:
             self.trackview.unselect_all()
             if self.active_row is not None:
                 self.active_row.set_active(False)
             self.active_row = row
             self.active_row.set_active(True)
             self.row = self.active_row.index
-            if row is not None:
-                self.trackview.select_row(row)
+            self.trackview.select_row(row)
 
     def add_track(self, filename):
-        audios = self.configuration.get('audios')
         try:
             anaudio = Audio(filename)
         except Exception as e:
             print(e)
             return
-        exists = False
-        for audio in audios:
-            if audio == anaudio:
-                exists = True
-                break
-        if exists is False:
+        self.add_audio(anaudio)
+
+    def add_audio(self, anaudio):
+        audios = self.audios
+        if anaudio['hash'] in self.index:
+            existing = self.index.get_audio(anaudio['hash'])
+            if self.configuration.get('verify_content') is True and\
+                    'content_hash' not in anaudio.keys() and\
+                    existing['filepath'] != anaudio['filepath']:
+                # A duplicate for now, the verifier may tell otherwise
+                self.check_collision(anaudio, existing)
+        else:
+            prepare(anaudio)
             audios.append(anaudio)
-            row = ListBoxRowWithData(anaudio, len(audios) - 1)
-            row.set_active(False)
-            row.connect('button_info_clicked',
-                        self.on_row_info, row)
-            row.connect('button_listened_clicked',
-                        self.on_row_listened,
-                        row)
-            row.connect('position-changed',
-                        self.on_row_position_changed,
-                        row)
-            GLib.idle_add(row.show)
-            GLib.idle_add(self.trackview.add, row)
-        GLib.idle_add(self.trackview.show_all)
-        self.configuration.set('audios', audios)
-        self.configuration.save()
-
-    def on_row_position_changed(self, widget, position, row):
+            self.library.add(anaudio, len(audios) - 1)
+            # The row is added with the next batch, the index dedupes now
+            self.index.add(anaudio)
+            self.trackview.queue_insert(anaudio)
+
+    def on_rows_added(self, trackview, rows):
+        for row in rows:
+            if row.audio['hash'] in self.index:
+                self.index.add(row.audio, row)
+                self.search_index.add(row.audio)
+                self.thumbnailer.request(row.audio)
+        if len(self.search_entry.get_text()) > 0:
+            self.on_search_changed(self.search_entry)
+
+    def build_search_index(self):
+        '''
+        Index the library from a thread, the tracks added or removed
+        meanwhile are applied when it is done
+        '''
+        audios = list(self.audios)
+
+        def build():
+            search_index = SearchIndex()
+            search_index.build(audios)
+            GLib.idle_add(self.on_search_index_built, search_index)
+
+        builder = Thread(target=build)
+        builder.daemon = True
+        builder.start()
+
+    def on_search_index_built(self, search_index):
+        hashes = self.index.get_hashes()
+        for hash in set(search_index.tokens.keys()) - hashes:
+            search_index.remove(hash)
+        for hash in hashes - search_index.tokens.keys():
+            search_index.add(self.index.get_audio(hash))
+        self.search_index = search_index
+        if len(self.search_entry.get_text()) > 0:
+            self.on_search_changed(self.search_entry)
+        return False
+
+    def on_search_changed(self, entry):
+        self.populate_all()
+        matches = self.search_index.search(entry.get_text())
+        if matches is not None:
+            matches = [self.index.get_row(hash) for hash in matches
+                       if self.index.get_row(hash) is not None]
+        self.trackview.set_matches(matches)
+
+    def on_row_position_changed(self, widget, row, position):
         print(widget, position, row)
         if self.active_row is not None:
             self.control['position'].handler_block_by_func(
@@ -1253,12 +1652,28 @@ class MainWindow(Gtk.ApplicationWindow):
             self.control['position'].handler_unblock_by_func(
                 self.on_position_button_changed)
 
-    def add_tracks_in_background(self, filenames, play=True):
-        if len(filenames) > 0:
-            number_of_audios = len(self.configuration.get('audios'))
-            diib = DoItInBackground(self.add_track, filenames)
+    def add_files(self, paths):
+        '''
+        Add the files and directories in paths, once the library is loaded.
+        While only the snapshot is there they wait in pending_files
+        '''
+        if self.library_loaded:
+            self.add_tracks_in_background(paths)
+        else:
+            self.pending_files.extend(paths)
+
+    def add_tracks_in_background(self, paths, play=True):
+        if len(paths) > 0:
+            # New rows go after every row of the library
+            self.populate_all()
+            number_of_audios = len(self.audios)
+            filenames = itertools.chain.from_iterable(scan(paths))
+            diib = Ingester(self.add_audio, filenames)
             progreso = ProgressDialog(_('Adding new tracks'), self)
-            progreso.set_number_of_elements(len(filenames))
+            if any(os.path.isdir(path) for path in paths):
+                progreso.set_number_of_elements(0)
+            else:
+                progreso.set_number_of_elements(len(paths))
             diib.connect('started_one', progreso.set_element)
             # diib.connect('done_one', progreso.increase)
             diib.connect('ended', progreso.close)
@@ -1266,47 +1681,30 @@ class MainWindow(Gtk.ApplicationWindow):
             diib.start()
             progreso.run()
             if play is True:
-                if len(self.configuration.get('audios')) > number_of_audios:
+                if len(self.audios) > number_of_audios:
                     self.play_row_by_index(number_of_audios)
-                else:
-                    try:
-                        audio = Audio(filenames[0])
-                        self.play_row_by_audio(audio)
-                    except Exception as e:
-                        print(e)
+                elif diib.first_audio is not None:
+                    self.play_row_by_audio(diib.first_audio)
 
     def add_tracks_sync(self, filenames, play=True):
+        self.populate_all()
         self.get_root_window().set_cursor(WAIT_CURSOR)
         play_audio = None
-        audios = self.configuration.get('audios')
+        audios = self.audios
         for index, filename in enumerate(filenames):
             anaudio = Audio(filename)
-            exists = False
-            for audio in audios:
-                if audio == anaudio:
-                    if play_audio is None:
-                        play_audio = audio
-                    exists = True
-                    break
-            if exists is False:
+            audio = self.index.get_audio(anaudio['hash'])
+            if audio is not None:
+                if play_audio is None:
+                    play_audio = audio
+            else:
+                prepare(anaudio)
                 audios.append(anaudio)
-                row = ListBoxRowWithData(anaudio, len(audios) - 1)
-                row.connect('button_info_clicked',
-                            self.on_row_info, row)
-                row.connect('button_listened_clicked',
-                            self.on_row_listened,
-                            row)
-                row.connect('position-changed',
-                            self.on_row_position_changed,
-                            row)
-                row.show()
-                row.set_active(False)
+                self.library.add(anaudio, len(audios) - 1)
+                self.add_row(anaudio)
+                self.search_index.add(anaudio)
                 if play_audio is None:
-                    play_audio = row.audio
-                self.trackview.add(row)
-        self.trackview.show_all()
-        self.configuration.set('audios', audios)
-        self.configuration.save()
+                    play_audio = anaudio
 
         self.get_root_window().set_cursor(DEFAULT_CURSOR)
         if play is True and play_audio is not None:
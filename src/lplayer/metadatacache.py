@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from . import comun
+
+
+class MetadataCache(object):
+    '''
+    On disk cache of the metadata of audio files. An entry is only valid
+    while the path, size, mtime and inode of the file are the same
+    '''
+    MAX_ENTRIES = 50000
+    EVICT_EVERY = 500
+
+    def __init__(self, filename=comun.METADATA_CACHE_FILE,
+                 max_entries=MAX_ENTRIES):
+        self.filename = filename
+        self.max_entries = max_entries
+        # One connection per thread, sqlite3 ties them to their thread
+        self.local = threading.local()
+        self.inserts = 0
+
+    def get_connection(self):
+        # sqlite connections can't be shared with forked ingest workers
+        local = self.local
+        if getattr(local, 'connection', None) is None or\
+                local.pid != os.getpid():
+            connection = sqlite3.connect(self.filename, timeout=30,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                'inode INTEGER, atime REAL, data TEXT)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS metadata_atime '
+                'ON metadata (atime)')
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def get(self, filepath):
+        try:
+            stat = os.stat(filepath)
+            connection = self.get_connection()
+            row = connection.execute(
+                'SELECT size, mtime_ns, inode, data FROM metadata '
+                'WHERE path=?', (filepath,)).fetchone()
+            if row is None:
+                return None
+            if row[0] != stat.st_size or row[1] != stat.st_mtime_ns or\
+                    row[2] != stat.st_ino:
+                self.invalidate(filepath)
+                return None
+            connection.execute('UPDATE metadata SET atime=? WHERE path=?',
+                               (time.time(), filepath))
+            return json.loads(row[3])
+        except Exception as e:
+            print(e)
+        return None
+
+    def set(self, filepath, data):
+        try:
+            stat = os.stat(filepath)
+            connection = self.get_connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)',
+                (filepath, stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                 time.time(), json.dumps(data)))
+            self.inserts += 1
+            if self.inserts % MetadataCache.EVICT_EVERY == 0:
+                self.evict()
+        except Exception as e:
+            print(e)
+
+    def invalidate(self, filepath):
+        try:
+            self.get_connection().execute(
+                'DELETE FROM metadata WHERE path=?', (filepath,))
+        except Exception as e:
+            print(e)
+
+    def evict(self):
+        '''
+        Keep only the max_entries most recently used entries
+        '''
+        self.get_connection().execute(
+            'DELETE FROM metadata WHERE path IN (SELECT path FROM metadata '
+            'ORDER BY atime DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def clear(self):
+        self.get_connection().execute('DELETE FROM metadata')
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import codecs
+import os
+import time
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+
+def write_atomically(filename, data):
+    '''
+    Write to a temporary file and rename it over filename, so the file is
+    always either the old or the new content
+    '''
+    temporal = filename + '.tmp'
+    if isinstance(data, bytes):
+        f = open(temporal, 'wb')
+    else:
+        f = codecs.open(temporal, 'w', 'utf-8')
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(temporal, filename)
+
+
+class WriteBehind(Thread):
+    '''
+    Coalesce changes and write them from a background thread, at most once
+    every interval seconds
+    '''
+    def __init__(self, flush_callback, interval=5.0):
+        Thread.__init__(self)
+        self.daemon = True
+        self.flush_callback = flush_callback
+        self.interval = interval
+        self.dirty = False
+        self.stopped = False
+        self.event = Event()
+        self.lock = Lock()
+        self.flush_count = 0
+        self.flush_time = 0.0
+        self.last_flush_time = 0.0
+
+    def set_interval(self, interval):
+        self.interval = interval
+
+    def mark_dirty(self):
+        self.dirty = True
+        if not self.is_alive() and not self.stopped:
+            try:
+                self.start()
+            except RuntimeError:
+                # Another thread started it meanwhile
+                pass
+
+    def run(self):
+        while not self.stopped:
+            self.event.wait(self.interval)
+            self.event.clear()
+            self.flush()
+
+    def flush(self):
+        '''
+        Write now if anything has changed. Safe from any thread
+        '''
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            start = time.perf_counter()
+            try:
+                self.flush_callback()
+            except Exception as e:
+                print(e)
+                self.dirty = True
+            self.last_flush_time = time.perf_counter() - start
+            self.flush_time += self.last_flush_time
+            self.flush_count += 1
+
+    def stop(self):
+        '''
+        Stop the thread and write what is pending before returning
+        '''
+        self.stopped = True
+        self.event.set()
+        self.flush()
+
+    def get_stats(self):
+        with self.lock:
+            return {'flush_count': self.flush_count,
+                    'flush_time': self.flush_time,
+                    'last_flush_time': self.last_flush_time}
+
+
+if __name__ == '__main__':
+    writes = []
+    writer = WriteBehind(lambda: writes.append(time.time()), interval=0.1)
+    for i in range(10000):
+        writer.mark_dirty()
+    time.sleep(0.3)
+    writer.stop()
+    stats = writer.get_stats()
+    print('10000 changes, {0} flushes, {1:.6f} s writing'.format(
+        stats['flush_count'], stats['flush_time']))
+    assert stats['flush_count'] == len(writes) < 10
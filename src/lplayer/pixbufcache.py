@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gi
+try:
+    gi.require_version('GdkPixbuf', '2.0')
+except Exception as e:
+    print(e)
+    exit(1)
+from gi.repository import GdkPixbuf
+from collections import OrderedDict
+import os
+from . import comun
+from .utils import THUMBNAIL_SIZES
+from .utils import get_thumbnail_filename
+
+BUDGET = 32 * 1024 * 1024
+
+
+def get_pixbuf_size(pixbuf):
+    return pixbuf.get_rowstride() * pixbuf.get_height()
+
+
+def load_pixbuf(art_id, size, scale=1):
+    '''
+    Load the artwork from the smallest stored thumbnail that is not
+    smaller than size. None if there is no thumbnail yet
+    '''
+    if art_id is None:
+        return None
+    sizes = [asize for asize in THUMBNAIL_SIZES if asize >= size] or\
+        [THUMBNAIL_SIZES[-1]]
+    for asize in sizes:
+        for ascale in sorted(set([scale, 1]), reverse=True):
+            filename = get_thumbnail_filename(art_id, asize, ascale)
+            if os.path.exists(filename):
+                try:
+                    return GdkPixbuf.Pixbuf.new_from_file_at_size(
+                        filename, size * scale, size * scale)
+                except Exception as e:
+                    print(e)
+    return None
+
+
+class PixbufCache(object):
+    '''
+    Decoded artwork shared by every widget, keyed by (art id, size, scale).
+    The least recently used pixbufs go when the memory budget is exceeded
+    '''
+    def __init__(self, budget=BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.pixbufs = OrderedDict()
+
+    def lookup(self, art_id, size, scale=1):
+        key = (art_id, size, scale)
+        if key in self.pixbufs:
+            self.pixbufs.move_to_end(key)
+            return self.pixbufs[key]
+        return None
+
+    def get(self, art_id, size, scale=1):
+        '''
+        The artwork at size, the placeholder while it has no thumbnail
+        '''
+        pixbuf = self.lookup(art_id, size, scale)
+        if pixbuf is None:
+            pixbuf = load_pixbuf(art_id, size, scale)
+            if pixbuf is not None:
+                self.put(art_id, size, scale, pixbuf)
+            else:
+                pixbuf = self.get_placeholder(size, scale)
+        return pixbuf
+
+    def get_placeholder(self, size, scale=1):
+        pixbuf = self.lookup(None, size, scale)
+        if pixbuf is None:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
+                comun.NOIMAGE_ICON, size * scale, size * scale)
+            self.put(None, size, scale, pixbuf)
+        return pixbuf
+
+    def put(self, art_id, size, scale, pixbuf):
+        key = (art_id, size, scale)
+        if key in self.pixbufs:
+            self.used -= get_pixbuf_size(self.pixbufs.pop(key))
+        self.pixbufs[key] = pixbuf
+        self.used += get_pixbuf_size(pixbuf)
+        while self.used > self.budget and len(self.pixbufs) > 1:
+            key, old = self.pixbufs.popitem(last=False)
+            self.used -= get_pixbuf_size(old)
+
+    def invalidate(self, art_id):
+        for key in [key for key in self.pixbufs.keys() if key[0] == art_id]:
+            self.used -= get_pixbuf_size(self.pixbufs.pop(key))
+
+
+pixbuf_cache = PixbufCache()
@@ -38,6 +38,11 @@ from gi.repository import GLib
 from gi.repository import GObject
 from enum import Enum
 
+# GstPlayFlags audio | soft-volume
+AUDIO_FLAGS = 0x02 | 0x10
+# Changes the rate without flushing, GStreamer 1.18 or newer
+INSTANT_RATE_CHANGE = getattr(Gst.SeekFlags, 'INSTANT_RATE_CHANGE', None)
+
 
 class Status(Enum):
     STOPPED = 0
@@ -51,6 +56,7 @@ class Player(GObject.GObject):
         'stopped': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, (int,)),
         'paused': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, (int,)),
         'track-end': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, ()),
+        'track-changed': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, ()),
     }
 
     def __init__(self):
@@ -58,6 +64,21 @@ class Player(GObject.GObject):
         Gst.init_check(None)
         self.status = Status.STOPPED
         self.player = None
+        self.audio_filter = None
+        # The track that follows without a gap, and if it has been queued
+        self.next_filename = None
+        self.gapless = False
+        # What the bus said about the pipeline, it is never waited for
+        self.state = Gst.State.NULL
+        self.pending_state = Gst.State.VOID_PENDING
+        self.target_state = Gst.State.NULL
+        # A seek asked before the pipeline could take it, and the position
+        self.seek_pending = False
+        self.pending_seek = None
+        self.last_position = 0
+        self.last_duration = 0
+        # The rate of the current segment
+        self.applied_rate = 1.0
         self.speed = 1.0
         self.volume = 1.0
         self.amplification = 1.0
@@ -74,25 +95,73 @@ class Player(GObject.GObject):
         Get the status of the player
         '''
         if self.player is not None:
-            if self.player.get_state(Gst.CLOCK_TIME_NONE)[1] ==\
-                    Gst.State.PLAYING:
+            if self.target_state == Gst.State.PLAYING:
                 return Status.PLAYING
-            elif self.player.get_state(Gst.CLOCK_TIME_NONE)[1] ==\
-                    Gst.State.PAUSED:
+            elif self.target_state == Gst.State.PAUSED:
                 return Status.PAUSED
         return Status.STOPPED
 
+    def set_state(self, state):
+        '''
+        Change the state without waiting for it. Going down is synchronous,
+        so it is recorded now; going up is recorded from the bus
+        '''
+        self.target_state = state
+        self.player.set_state(state)
+        if int(state) < int(self.state):
+            self.state = state
+            self.pending_state = Gst.State.VOID_PENDING
+
+    def seek(self, position=None):
+        '''
+        Seek to position, in seconds, or to where it is playing to apply the
+        speed. Until the pipeline is paused the seek is kept pending
+        '''
+        if position is not None:
+            self.pending_seek = position
+            self.last_position = position
+        self.seek_pending = True
+        if self.state in (Gst.State.PAUSED, Gst.State.PLAYING):
+            self.do_pending_seek()
+
+    def do_pending_seek(self):
+        if self.pending_seek is not None:
+            nanosecs = int(self.pending_seek * Gst.SECOND)
+        else:
+            ok, nanosecs = self.player.query_position(Gst.Format.TIME)
+            if not ok:
+                nanosecs = int(self.last_position * Gst.SECOND)
+        if self.player.seek(self.speed, Gst.Format.TIME, Gst.SeekFlags.FLUSH,
+                            Gst.SeekType.SET, nanosecs, Gst.SeekType.NONE,
+                            -1):
+            self.seek_pending = False
+            self.pending_seek = None
+            self.applied_rate = self.speed
+
     def get_player(self):
-        player = Gst.parse_launch('uridecodebin name=urisrc !\
- audioconvert ! audioresample ! queue ! removesilence name=removesilence !\
+        '''
+        The pipeline lives as long as the player, a track change only
+        switches the uri of the playbin. The DSP elements go in its
+        audio-filter and the sink is kept open between tracks
+        '''
+        player = Gst.ElementFactory.make('playbin', 'player')
+        # Audio only, the cover art of a file is not a video stream
+        player.set_property('flags', AUDIO_FLAGS)
+        self.audio_filter = Gst.parse_bin_from_description(
+            'queue ! removesilence name=removesilence !\
  audioconvert ! audioresample ! queue ! scaletempo !\
  audioconvert ! audioresample ! volume name=volume !\
  audioamplify name=amplification !\
- equalizer-nbands name=equalizer num-bands=18 !\
- autoaudiosink')
+ equalizer-nbands name=equalizer num-bands=18 ! audioconvert', True)
+        player.set_property('audio-filter', self.audio_filter)
+        player.set_property('audio-sink',
+                            Gst.ElementFactory.make('autoaudiosink', None))
+        player.connect('about-to-finish', self.on_about_to_finish)
+        self.apply_filters()
         bus = player.get_bus()
         bus.add_signal_watch()
         bus.connect("message::eos", self.on_eos)
+        bus.connect('message::stream-start', self.on_stream_start)
         bus.connect('message::state-changed', self.on_state_changed)
         bus.connect('message', self.on_player_message)
         bus.connect("message::error", self.test)
@@ -100,6 +169,40 @@ class Player(GObject.GObject):
         bus.connect('sync-message', self.test)
         return player
 
+    def get_element(self, name):
+        return self.audio_filter.get_by_name(name)
+
+    def apply_filters(self):
+        self.get_element('removesilence').set_property('remove',
+                                                       self.removesilence)
+        self.get_element('volume').set_property('volume', self.volume)
+        self.get_element('amplification').set_property('amplification',
+                                                       self.amplification)
+        self.apply_equalizer()
+
+    def apply_equalizer(self):
+        equalizer = self.get_element('equalizer')
+        for i in range(0, 18):
+            equalizer.get_child_by_index(i).set_property(
+                'gain', self.equalizer.get('band{0}'.format(i), 0))
+
+    def apply_speed(self):
+        '''
+        Change the rate of the playing segment, in place when GStreamer can
+        do it and with a flushing seek otherwise
+        '''
+        if self.state not in (Gst.State.PAUSED, Gst.State.PLAYING):
+            # play() seeks with the new rate
+            return
+        if INSTANT_RATE_CHANGE is not None and\
+                (self.speed > 0) == (self.applied_rate > 0):
+            if self.player.seek(self.speed, Gst.Format.TIME,
+                                INSTANT_RATE_CHANGE, Gst.SeekType.NONE, 0,
+                                Gst.SeekType.NONE, 0):
+                self.applied_rate = self.speed
+                return
+        self.seek()
+
     def test(self, widget, message):
         print('test', widget, message)
 
@@ -107,56 +210,83 @@ class Player(GObject.GObject):
         GLib.idle_add(GObject.GObject.emit, self, *args)
 
     def on_eos(self, bus, msg):
-        self.emit('track-end')
+        # track-end is emitted by on_player_message
         print("End-Of-Stream reached")
 
+    def on_about_to_finish(self, playbin):
+        '''
+        From a streaming thread, the next uri has to be set now to be
+        prerolled while the current track is still playing
+        '''
+        filename = self.next_filename
+        if filename is not None:
+            self.next_filename = None
+            self.gapless = True
+            playbin.set_property('uri', Gst.filename_to_uri(filename))
+
+    def on_stream_start(self, bus, msg):
+        if self.gapless:
+            self.gapless = False
+            self.last_position = 0
+            self.last_duration = 0
+            # The new stream starts at the normal rate
+            self.applied_rate = 1.0
+            if self.speed != 1.0:
+                self.seek()
+            self.emit('track-changed')
+
     def on_player_message(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
-            self.player.set_state(Gst.State.NULL)
+            self.set_state(Gst.State.NULL)
             self.emit('track-end')
         elif t == Gst.MessageType.ERROR:
-            self.player.set_state(Gst.State.NULL)
+            self.set_state(Gst.State.NULL)
             err, debug = message.parse_error()
             print('--------@@@ Error: %s' % err, debug)
             self.emit('track-end')
 
     def on_state_changed(self, bus, msg):
+        if msg.src != self.player:
+            return
         old, new, pending = msg.parse_state_changed()
-        # print('-ee--', old, new, pending, '---')
+        self.state = new
+        self.pending_state = pending
+        if self.seek_pending and new in (Gst.State.PAUSED,
+                                         Gst.State.PLAYING):
+            self.do_pending_seek()
+
+    def set_next_filename(self, filename):
+        '''
+        The track to play after the current one with no silence between,
+        None to stop at the end of the current one
+        '''
+        self.next_filename = filename
 
     def set_filename(self, filename):
-        if self.player is not None:
-            self.player.set_state(Gst.State.NULL)
-        self.player = self.get_player()
-        self.player.get_by_name('urisrc').set_property('uri',
-                                                       'file://' + filename)
+        self.next_filename = None
+        self.gapless = False
+        if self.player is None:
+            self.player = self.get_player()
+        else:
+            # READY frees the decoders but keeps the audio sink
+            self.set_state(Gst.State.READY)
+        self.seek_pending = False
+        self.pending_seek = None
+        self.last_position = 0
+        self.last_duration = 0
+        self.applied_rate = 1.0
+        self.player.set_property('uri', Gst.filename_to_uri(filename))
 
     def play(self):
         '''
         Play the player
         '''
         if self.player is not None:
-            self.player.set_state(Gst.State.PLAYING)
-            self.player.get_state(Gst.CLOCK_TIME_NONE)
-            self.player.get_by_name('removesilence').set_property(
-                'remove', self.removesilence)
-            self.player.get_by_name('volume').set_property('volume',
-                                                           self.volume)
-            self.player.get_by_name('amplification').set_property(
-                'amplification', self.amplification)
-            equalizer = self.player.get_by_name('equalizer')
-            for i in range(0, 18):
-                band = 'band{0}'.format(i)
-                if band in self.equalizer.keys():
-                    equalizer.get_child_by_index(i).set_property(
-                        'gain', self.equalizer[band])
-                else:
-                    equalizer.get_child_by_index(i).set_property(
-                        'gain', 0)
-            pos = self.player.query_position(Gst.Format.TIME)[1]
-            self.player.seek(self.speed, Gst.Format.TIME, Gst.SeekFlags.FLUSH,
-                             Gst.SeekType.SET, pos, Gst.SeekType.NONE, -1)
+            self.set_state(Gst.State.PLAYING)
+            # The filters are always up to date, only a new rate needs a seek
+            if self.seek_pending or self.applied_rate != self.speed:
+                self.seek()
             self.status = Status.PLAYING
             self.emit('started', self.get_position())
 
@@ -165,7 +295,7 @@ class Player(GObject.GObject):
         Pause the player
         '''
         if self.player is not None:
-            self.player.set_state(Gst.State.PAUSED)
+            self.set_state(Gst.State.PAUSED)
             self.status = Status.PAUSED
             self.emit('paused', self.get_position())
 
@@ -174,7 +304,7 @@ class Player(GObject.GObject):
         Stop the player
         '''
         if self.player is not None:
-            self.player.set_state(Gst.State.READY)
+            self.set_state(Gst.State.READY)
             self.status = Status.STOPPED
             self.emit('stopped', self.get_position())
 
@@ -183,8 +313,8 @@ class Player(GObject.GObject):
         Set player volume
         '''
         self.volume = volume
-        if self.get_status() == Status.PLAYING:
-            self.play()
+        if self.audio_filter is not None:
+            self.get_element('volume').set_property('volume', volume)
 
     def get_volume(self):
         '''
@@ -197,8 +327,9 @@ class Player(GObject.GObject):
         Set if player removes silences
         '''
         self.removesilence = removesilence
-        if self.get_status() == Status.PLAYING:
-            self.play()
+        if self.audio_filter is not None:
+            self.get_element('removesilence').set_property('remove',
+                                                           removesilence)
 
     def get_removesilence(self):
         '''
@@ -207,9 +338,10 @@ class Player(GObject.GObject):
         return self.removesilence
 
     def set_equalizer(self, equalizer):
-        self.equalizer = equalizer
-        if self.get_status() == Status.PLAYING:
-            self.play()
+        # Its own copy, the caller's dict may be the configuration one
+        self.equalizer = dict(equalizer)
+        if self.audio_filter is not None:
+            self.apply_equalizer()
 
     def set_equalizer_by_band(self, band, gain):
         '''
@@ -227,10 +359,19 @@ class Player(GObject.GObject):
         band9 gain for the frequency band 15011 Hz, from -24 dB to +12 dB
         '''
         if band >= 0 and band <= 9 and gain >= -24 and gain <= 12:
-            band = 'band{0}'.format(band)
-            self.equalizer[band] = gain
-        if self.get_status() == Status.PLAYING:
-            self.play()
+            self.equalizer['band{0}'.format(band)] = gain
+            if self.audio_filter is not None:
+                self.get_element('equalizer').get_child_by_index(
+                    band).set_property('gain', gain)
+
+    def set_equalizer_gains(self, gains):
+        '''
+        Set the gains of the first len(gains) bands at once
+        '''
+        for index, gain in enumerate(gains):
+            self.equalizer['band{0}'.format(index)] = gain
+        if self.audio_filter is not None:
+            self.apply_equalizer()
 
     def get_equalizer(self):
         '''
@@ -243,8 +384,8 @@ class Player(GObject.GObject):
         Set player speed
         '''
         self.speed = speed
-        if self.get_status() == Status.PLAYING:
-            self.play()
+        if self.player is not None and self.applied_rate != speed:
+            self.apply_speed()
 
     def get_speed(self):
         '''
@@ -254,86 +395,88 @@ class Player(GObject.GObject):
 
     def set_position(self, position):
         if self.player is not None:
-            self.player.get_state(Gst.CLOCK_TIME_NONE)
-            self.player.set_state(Gst.State.PAUSED)
-            try:
-                assert self.player.seek_simple(Gst.Format.TIME,
-                                               Gst.SeekFlags.FLUSH,
-                                               position * Gst.SECOND)
-                self.player.get_state(Gst.CLOCK_TIME_NONE)
-                pos = self.player.query_position(Gst.Format.TIME)[1]
-                self.player.seek(self.speed, Gst.Format.TIME,
-                                 Gst.SeekFlags.FLUSH, Gst.SeekType.SET, pos,
-                                 Gst.SeekType.NONE, -1)
-            except AssertionError as e:
-                print(e)
-            self.player.set_state(Gst.State.PLAYING)
+            self.set_state(Gst.State.PAUSED)
+            self.seek(position)
+            self.set_state(Gst.State.PLAYING)
 
     def get_position(self):
+        '''
+        Where it is playing, in seconds. Never waits for the pipeline, while
+        it can not answer the last known position is returned
+        '''
         if self.player is not None:
-            self.player.get_state(Gst.CLOCK_TIME_NONE)
-            nanosecs = self.player.query_position(Gst.Format.TIME)[1]
-            position = float(nanosecs) / Gst.SECOND
-            return position
+            if self.seek_pending and self.pending_seek is not None:
+                return self.pending_seek
+            ok, nanosecs = self.player.query_position(Gst.Format.TIME)
+            if ok:
+                self.last_position = float(nanosecs) / Gst.SECOND
+            return self.last_position
         return 0
 
     def get_duration(self):
         if self.player is not None:
-            self.player.get_state(Gst.CLOCK_TIME_NONE)
-            duration_nanosecs = self.player.query_duration(Gst.Format.TIME)[1]
-            duration = float(duration_nanosecs) / Gst.SECOND
-            return duration
+            ok, nanosecs = self.player.query_duration(Gst.Format.TIME)
+            if ok:
+                self.last_duration = float(nanosecs) / Gst.SECOND
+            return self.last_duration
         return 0
 
 
+def get_old_player(filename):
+    '''
+    The pipeline as it was built for every track, for the benchmark
+    '''
+    player = Gst.parse_launch('uridecodebin name=urisrc !\
+ audioconvert ! audioresample ! queue ! removesilence name=removesilence !\
+ audioconvert ! audioresample ! queue ! scaletempo !\
+ audioconvert ! audioresample ! volume name=volume !\
+ audioamplify name=amplification !\
+ equalizer-nbands name=equalizer num-bands=18 !\
+ autoaudiosink')
+    player.get_by_name('urisrc').set_property('uri',
+                                              Gst.filename_to_uri(filename))
+    return player
+
+
 if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
     import time
 
-    def fin(player, position, what):
-        print(player, position, what)
+    Gst.init(None)
+    if len(sys.argv) > 1:
+        filename = os.path.abspath(sys.argv[1])
+    else:
+        filename = os.path.join(tempfile.mkdtemp(), 'sample.wav')
+        pipeline = Gst.parse_launch(
+            'audiotestsrc num-buffers=200 ! wavenc ! filesink location="{0}"'
+            .format(filename))
+        pipeline.set_state(Gst.State.PLAYING)
+        pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE,
+                                              Gst.MessageType.EOS)
+        pipeline.set_state(Gst.State.NULL)
+    switches = 20
+
+    # Time from the track change until the pipeline is prerolled
+    old_player = None
+    start = time.perf_counter()
+    for i in range(switches):
+        if old_player is not None:
+            old_player.set_state(Gst.State.NULL)
+        old_player = get_old_player(filename)
+        old_player.set_state(Gst.State.PAUSED)
+        old_player.get_state(Gst.CLOCK_TIME_NONE)
+    old_player.set_state(Gst.State.NULL)
+    print('new pipeline per track: {0:.1f} ms/switch'.format(
+        (time.perf_counter() - start) * 1000 / switches))
 
-    print('start')
     player = Player()
-    player.set_filename('/home/lorenzo/Descargas/Telegram Desktop/01. Jenifer - Evidemment.mp3')
-    player.play()
-    player.set_position(0.95)
-    player.play()
-    player.set_speed(5)
-    time.sleep(50)
-    '''
-    player.set_equalizer_by_band(1, -12)
-    player.set_equalizer_by_band(3, -24)
-    player.set_equalizer_by_band(5, -12)
-    player.set_equalizer_by_band(7, -12)
-    print(player.get_status())
-    player.play()
-    time.sleep(5)
-    print(player.get_status())
-    # player.set_volume(1)
-    # player.set_speed(2.0)
-    # player.set_remove_silence(True)
-    player.set_equalizer_by_band(1, 12)
-    player.set_equalizer_by_band(3, 24)
-    player.set_equalizer_by_band(5, 12)
-    player.set_equalizer_by_band(7, 12)
-    player.set_equalizer_by_band(7, 12)
-    player.set_speed(2.0)
-    time.sleep(5)
-    player.pause()
-    print(player.get_status())
-    time.sleep(1)
-    print(player.get_position())
-    '''
-    '''
-    player.set_filename('/home/lorenzo/Descargas/sample.mp3')
-    player.connect('started', fin, 'started')
-    player.connect('paused', fin, 'paused')
-    player.connect('stopped', fin, 'stopped')
-    player.play()
-    player.set_speed(2)
-    time.sleep(10)
-    player.set_position(10)
-    time.sleep(2)
-    player.set_position(50)
-    time.sleep(2)
-    '''
+    start = time.perf_counter()
+    for i in range(switches):
+        player.set_filename(filename)
+        player.player.set_state(Gst.State.PAUSED)
+        player.player.get_state(Gst.CLOCK_TIME_NONE)
+    player.player.set_state(Gst.State.NULL)
+    print('reused playbin: {0:.1f} ms/switch'.format(
+        (time.perf_counter() - start) * 1000 / switches))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import struct
+import time
+from . import comun
+
+# track hash, position (fraction), listened, timestamp
+RECORD = struct.Struct('<64sd?d')
+MAX_RECORDS = 600
+
+
+class PositionJournal(object):
+    '''
+    Append only file of fixed size records with the playback state. Every
+    record is a single write, so it survives a crash of the player
+    '''
+    def __init__(self, filename=comun.JOURNAL_FILE, max_records=MAX_RECORDS):
+        self.filename = filename
+        self.max_records = max_records
+        self.file = open(filename, 'ab', buffering=0)
+        self.records = os.path.getsize(filename) // RECORD.size
+
+    def append(self, hash, position, listened):
+        self.file.write(RECORD.pack(hash.encode(), position, listened,
+                                    time.time()))
+        self.records += 1
+
+    def needs_compaction(self):
+        return self.records >= self.max_records
+
+    def replay(self):
+        '''
+        The last state of every track in the journal, by hash. A torn
+        record at the end is ignored
+        '''
+        states = {}
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+            hash, position, listened, timestamp = RECORD.unpack_from(
+                data, offset)
+            states[hash.rstrip(b'\0').decode()] = (position, listened,
+                                                   timestamp)
+        return states
+
+    def truncate(self):
+        os.ftruncate(self.file.fileno(), 0)
+        self.records = 0
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+    filename = os.path.join(tempfile.mkdtemp(), 'journal')
+    journal = PositionJournal(filename)
+    start = time.perf_counter()
+    for i in range(10000):
+        journal.append('{0:x}-{1}'.format(i % 10, '0' * 32), i / 10000.0,
+                       False)
+    print('append', (time.perf_counter() - start) / 10000.0, 's/record')
+    print(journal.replay())
@@ -85,25 +85,18 @@ class PreferencesDialog(Gtk.Dialog):
         self.show_all()
 
     def load_preferences(self):
-        configuration = Configuration()
+        configuration = Configuration.get_default()
         self.download_on_added.set_active(
             configuration.get('download_on_added'))
         self.remove_on_listened.set_active(
             configuration.get('remove_on_listened'))
 
     def save_preferences(self):
-        print(1)
-        configuration = Configuration()
-        print(2)
+        configuration = Configuration.get_default()
         configuration.set('download_on_added',
                           self.download_on_added.get_active())
-        print(3)
         configuration.set('remove_on_listened',
                           self.remove_on_listened.get_active())
-        print(4)
-        configuration.save()
-        print(configuration)
-        print(5)
 
 
 if __name__ == '__main__':
@@ -112,3 +105,4 @@ if __name__ == '__main__':
         sid.hide()
         sid.save_preferences()
     sid.destroy()
+    Configuration.get_default().close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+from . import comun
+from .comun import _
+
+BANDS = 10
+MIN_GAIN = -24
+MAX_GAIN = 12
+
+# The gains of the first ten bands, from https://gist.github.com/kra3/9781800
+PRESETS = [
+    ('none', _('None'), [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('classical', _('Classical'),
+     [0.375, 0.375, 0.375, 0.375, 0.375, 0.375, -4.5, -4.5, -4.5, -6.0]),
+    ('club', _('Club'),
+     [0.375, 0.375, 2.25, 3.75, 3.75, 3.75, 2.25, 0.375, 0.375, 0.375]),
+    ('dance', _('Dance'), [6, 4.5, 1.5, 0, 0, -3.75, -4.5, -4.5, 0, 0]),
+    ('flat', _('Flat'),
+     [0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375]),
+    ('live', _('Live'),
+     [-3, 0.375, 2.625, 3.375, 3.75, 3.75, 2.625, 1.875, 1.875, 1.5]),
+    ('headphone', _('Headphone'),
+     [3, 6.75, 3.375, -2.25, -1.5, 1.125, 3, 6, 7.875, 9]),
+    ('rock', _('Rock'),
+     [4.875, 3, -3.375, -4.875, -2.25, 2.625, 5.625, 6.75, 6.75, 6.75]),
+    ('pop', _('Pop'),
+     [-1.125, 3, 4.5, 4.875, 3.375, -0.75, -1.5, -1.5, -1.125, -1.125]),
+    ('full-bass-and-treble', _('Full Bass and Treble'),
+     [4.5, 3.75, 0.375, -4.5, -3, 1.125, 5.25, 6.75, 7.5, 7.5]),
+    ('full-bass', _('Full Bass'),
+     [6, 6, 6, 3.75, 1.125, -2.625, -5.25, -6.375, -6.75, -6.75]),
+    ('full-treble', _('Full Treble'),
+     [-6, -6, -6, -2.625, 1.875, 6.75, 9.75, 9.75, 9.75, 10.5]),
+    ('soft', _('Soft'),
+     [3, 1.125, -0.75, -1.5, -0.75, 2.625, 5.25, 6, 6.75, 7.5]),
+    ('party', _('Party'),
+     [4.5, 4.5, 0.375, 0.375, 0.375, 0.375, 0.375, 0.375, 4.5, 4.5]),
+    ('ska', _('Ska'),
+     [-1.5, -3, -2.625, -0.375, 2.625, 3.75, 5.625, 6, 6.75, 6]),
+    ('soft-rock', _('Soft Rock'),
+     [2.625, 2.625, 1.5, -0.375, -2.625, -3.375, -2.25, -0.375, 1.875,
+      5.625]),
+    ('large-hall', _('Large Hall'),
+     [6.375, 6.375, 3.75, 3.75, 0.375, -3, -3, -3, 0.375, 0.375]),
+    ('reggae', _('Reggae'),
+     [0.375, 0.375, -0.375, -3.75, 0.375, 4.125, 4.125, 0.375, 0.375,
+      0.375]),
+    ('techno', _('Techno'),
+     [4.875, 3.75, 0.375, -3.375, -3, 0.375, 4.875, 6, 6, 5.625]),
+]
+
+
+def is_valid(gains):
+    return isinstance(gains, list) and len(gains) == BANDS and\
+        all([isinstance(gain, (int, float)) and
+             gain >= MIN_GAIN and gain <= MAX_GAIN for gain in gains])
+
+
+def load_presets(filename=comun.PRESETS_FILE):
+    '''
+    The presets by id, as (name, gains). The user ones come from a json
+    file like {"my-preset": {"name": "My preset", "gains": [0, ...]}} and
+    replace the built in preset with the same id
+    '''
+    presets = dict([(id, (name, gains)) for id, name, gains in PRESETS])
+    if not os.path.exists(filename):
+        return presets
+    try:
+        with open(filename, 'r') as f:
+            user_presets = json.load(f)
+        for id, preset in user_presets.items():
+            name = preset.get('name', presets.get(id, (id,))[0])
+            gains = preset.get('gains')
+            if is_valid(gains):
+                presets[id] = (name, gains)
+            else:
+                print('Wrong gains for preset', id)
+    except Exception as e:
+        print(e)
+    return presets
+
+
+if __name__ == '__main__':
+    import tempfile
+    filename = os.path.join(tempfile.mkdtemp(), 'presets.json')
+    with open(filename, 'w') as f:
+        json.dump({'voice': {'name': 'Voice',
+                             'gains': [-6, -3, 0, 3, 6, 6, 3, 0, -3, -6]},
+                   'rock': {'gains': [0] * BANDS},
+                   'wrong': {'gains': [100]}}, f)
+    presets = load_presets(filename)
+    assert presets['voice'][0] == 'Voice'
+    assert presets['rock'] == (_('Rock'), [0] * BANDS)
+    assert 'wrong' not in presets
+    assert len(presets) == len(PRESETS) + 1
+    print(len(presets), 'presets')
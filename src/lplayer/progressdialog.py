@@ -117,6 +117,8 @@ class ProgressDialog(Gtk.Dialog):
             fraction = float(self.number_of_elements_processed) / float(
                 self.number_of_elements)
             GLib.idle_add(self.progressbar.set_fraction, fraction)
+        else:
+            GLib.idle_add(self.progressbar.pulse)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import mimetypes
+
+ALLOWED_MIMETYPES = ['application/x-ogg', 'application/ogg',
+                     'audio/x-vorbis+ogg', 'audio/x-scpls', 'audio/x-mp3',
+                     'audio/x-mpeg', 'audio/mpeg', 'audio/x-mpegurl',
+                     'audio/flac', 'audio/m4a', 'audio/x-m4a', 'audio/mp4',
+                     'audio/aac']
+mimetypes.add_type('audio/aac', '.aac')
+BATCH_SIZE = 100
+
+
+def is_audio_file(filename):
+    return mimetypes.guess_type(filename)[0] in ALLOWED_MIMETYPES
+
+
+def scan(paths, batch_size=BATCH_SIZE):
+    '''
+    Walk paths, files or directories, and yield lists of at most batch_size
+    audio files as soon as they are found. Hidden entries are skipped and
+    every directory is visited only once, so symlink loops end
+    '''
+    batch = []
+    visited = set()
+    for path in paths:
+        if not os.path.isdir(path):
+            if is_audio_file(path) and os.path.isfile(path):
+                batch.append(path)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            continue
+        stack = [path]
+        while len(stack) > 0:
+            directory = stack.pop()
+            try:
+                stat = os.stat(directory)
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as e:
+                print(e)
+                continue
+            directories = []
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        directories.append(entry.path)
+                    elif is_audio_file(entry.name) and entry.is_file():
+                        batch.append(entry.path)
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = []
+                except OSError as e:
+                    print(e)
+            stack.extend(reversed(directories))
+    if len(batch) > 0:
+        yield batch
+
+
+if __name__ == '__main__':
+    import sys
+    for batch in scan(sys.argv[1:]):
+        print(len(batch), batch[0])
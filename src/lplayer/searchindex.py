@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+import unicodedata
+from bisect import bisect_left
+from bisect import insort
+from collections import defaultdict
+from functools import lru_cache
+
+FIELDS = ('title', 'artist', 'album', 'genre', 'year')
+WORD = re.compile(r'\w+')
+COMBINING = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff'
+                       '\u20d0-\u20ff\ufe20-\ufe2f]')
+# Prefixes up to this length match too many words to join their tracks on
+# every keystroke, their tracks are kept
+SHORT_PREFIX = 2
+
+
+def normalize(text):
+    '''
+    Case and accent folded text: 'Canción' and 'CANCION' are the same
+    '''
+    if text.isascii():
+        return text.casefold()
+    return COMBINING.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text):
+    return tuple(WORD.findall(normalize(text)))
+
+
+def get_short_prefixes(tokens):
+    return set([token[:length] for token in tokens
+                for length in range(1, SHORT_PREFIX + 1)])
+
+
+class SearchIndex(object):
+    '''
+    Tracks by the words in their metadata. The words are kept sorted, so
+    every word that starts with a prefix is a contiguous range
+    '''
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.words = []
+        self.tokens = {}
+        self.short = defaultdict(set)
+
+    def build(self, audios):
+        self.postings = defaultdict(set)
+        self.tokens = {}
+        self.short = defaultdict(set)
+        for audio in audios:
+            self.index(audio, False)
+        self.words = sorted(self.postings.keys())
+        # Joining whole sets is faster than adding track by track
+        for word in self.words:
+            for prefix in get_short_prefixes((word,)):
+                self.short[prefix] |= self.postings[word]
+
+    def index(self, audio, short=True):
+        hash = audio['hash']
+        tokens = set()
+        for field in FIELDS:
+            value = audio.get(field)
+            if value:
+                tokens.update(tokenize(str(value)))
+        self.tokens[hash] = tokens
+        for token in tokens:
+            self.postings[token].add(hash)
+        if short:
+            for prefix in get_short_prefixes(tokens):
+                self.short[prefix].add(hash)
+        return tokens
+
+    def add(self, audio):
+        if audio['hash'] in self.tokens:
+            self.remove(audio['hash'])
+        for token in self.index(audio):
+            if len(self.postings[token]) == 1:
+                insort(self.words, token)
+
+    def remove(self, hash):
+        tokens = self.tokens.pop(hash, ())
+        for token in tokens:
+            hashes = self.postings[token]
+            hashes.discard(hash)
+            if len(hashes) == 0:
+                del self.postings[token]
+                del self.words[bisect_left(self.words, token)]
+        for prefix in get_short_prefixes(tokens):
+            self.short[prefix].discard(hash)
+
+    def lookup(self, prefix):
+        if len(prefix) <= SHORT_PREFIX:
+            return self.short.get(prefix, set())
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + '\U0010ffff', start)
+        if end - start == 1:
+            return self.postings[self.words[start]]
+        return set().union(*[self.postings[word]
+                             for word in self.words[start:end]])
+
+    def search(self, query):
+        '''
+        The hashes of the tracks with a word starting with every word of
+        the query. None for an empty query, that is every track
+        '''
+        prefixes = list(tokenize(query))
+        if len(prefixes) == 0:
+            return None
+        # The longest prefixes match less
+        prefixes.sort(key=len, reverse=True)
+        result = set(self.lookup(prefixes[0]))
+        for prefix in prefixes[1:]:
+            if len(result) == 0:
+                break
+            result &= self.lookup(prefix)
+        return result
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+if __name__ == '__main__':
+    import random
+    import time
+    random.seed(0)
+    syllables = ['ba', 'be', 'ca', 'ción', 'da', 'de', 'el', 'fa', 'go',
+                 'ja', 'ka', 'la', 'lé', 'ma', 'mo', 'na', 'ño', 'pa', 'ra',
+                 're', 'sa', 'so', 'ta', 'te', 'to', 'va', 'ven', 'za']
+
+    def word():
+        return ''.join(random.choice(syllables)
+                       for index in range(random.randint(2, 4))).title()
+
+    artists = [word() + ' ' + word() for index in range(3000)]
+    audios = [{'hash': str(index),
+               'title': ' '.join(word() for i in range(random.randint(1, 5))),
+               'artist': random.choice(artists),
+               'album': word() + ' ' + word(),
+               'year': str(random.randint(1950, 2019))}
+              for index in range(100000)]
+    search_index = SearchIndex()
+    start = time.perf_counter()
+    search_index.build(audios)
+    print('build {0} tracks, {1} words: {2:.0f} ms'.format(
+        len(audios), len(search_index.words),
+        (time.perf_counter() - start) * 1000))
+    worst = 0
+    for query in ['Beethoven sonata', audios[1234]['artist'],
+                  audios[4321]['title'], 'canción ma', 'LE TO 19']:
+        for length in range(1, len(query) + 1):
+            start = time.perf_counter()
+            result = search_index.search(query[:length])
+            worst = max(worst, time.perf_counter() - start)
+        print('{0!r}: {1} tracks'.format(query, len(result or ())))
+    start = time.perf_counter()
+    for audio in audios[:1000]:
+        search_index.remove(audio['hash'])
+        search_index.add(audio)
+    print('update: {0:.3f} ms/track'.format(
+        (time.perf_counter() - start)))
+    print('worst keystroke: {0:.2f} ms (frame: 16.7 ms)'.format(
+        worst * 1000))
+    assert worst < 1 / 60.0
@@ -26,16 +26,15 @@
 import gi
 try:
     gi.require_version('Gtk', '3.0')
-    gi.require_version('GdkPixbuf', '2.0')
 except Exception as e:
     print(e)
     exit(1)
 from gi.repository import Gtk
-from gi.repository import GdkPixbuf
 import os
 try:
     from . import comun
     from .comun import _
+    from .pixbufcache import pixbuf_cache
 except Exception as e:
     import sys
     PACKAGE_PARENT = '..'
@@ -45,6 +44,7 @@ except Exception as e:
     import comun
     from audio import Audio
     from comun import _
+    from pixbufcache import pixbuf_cache
 
 
 class ShowInfoDialog(Gtk.Dialog):
@@ -79,15 +79,7 @@ class ShowInfoDialog(Gtk.Dialog):
         image = Gtk.Image()
         grid.attach(image, 0, 0, 4, 4)
 
-        filename = os.path.join(
-            comun.THUMBNAILS_DIR, '{0}.png'.format(audio['hash']))
-        if os.path.exists(filename):
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                filename, 256, 256)
-        else:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                comun.NOIMAGE_ICON, 256, 256)
-        image.set_from_pixbuf(pixbuf)
+        image.set_from_pixbuf(pixbuf_cache.get(audio.get('art_id'), 256))
 
         label = Gtk.Label(_('Artist') + ': ')
         label.set_alignment(0, 0.5)
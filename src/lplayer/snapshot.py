@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+import os
+import struct
+from . import comun
+from .persistence import write_atomically
+
+MAGIC = b'LPSS'
+VERSION = 2
+# magic, version, number of tracks. The tracks follow by columns: the
+# lengths, positions and listened flags, then every string column as its
+# size and the values separated by NUL
+HEADER = struct.Struct('<4sHI')
+SIZE = struct.Struct('<I')
+STRINGS = ('hash', 'filepath', 'title', 'artist', 'album', 'year',
+           'art_id')
+KEYS = ('length', 'position', 'listened') + STRINGS
+
+
+def write_snapshot(audios, filename=comun.SNAPSHOT_FILE):
+    '''
+    Store what the first screen needs of every track, in order
+    '''
+    count = len(audios)
+    chunks = [HEADER.pack(MAGIC, VERSION, count),
+              struct.pack('<{0}d'.format(count),
+                          *[audio['length'] for audio in audios]),
+              struct.pack('<{0}d'.format(count),
+                          *[audio['position'] for audio in audios]),
+              struct.pack('<{0}?'.format(count),
+                          *[audio['listened'] for audio in audios])]
+    for key in STRINGS:
+        column = '\0'.join([str(audio.get(key) or '').replace('\0', '')
+                            for audio in audios]).encode('utf-8')
+        chunks.append(SIZE.pack(len(column)))
+        chunks.append(column)
+    write_atomically(filename, b''.join(chunks))
+
+
+def read_snapshot(filename=comun.SNAPSHOT_FILE):
+    '''
+    The tracks in the snapshot, None if there is no usable snapshot
+    '''
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return None
+    try:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, count = HEADER.unpack_from(data, 0)
+                if magic != MAGIC or version != VERSION:
+                    return None
+                offset = HEADER.size
+                columns = []
+                for code, size in (('d', 8), ('d', 8), ('?', 1)):
+                    columns.append(struct.unpack_from(
+                        '<{0}{1}'.format(count, code), data, offset))
+                    offset += count * size
+                for key in STRINGS:
+                    size = SIZE.unpack_from(data, offset)[0]
+                    offset += SIZE.size
+                    if offset + size > len(data):
+                        return None
+                    column = data[offset:offset + size].decode('utf-8')
+                    offset += size
+                    columns.append(column.split('\0') if count > 0 else [])
+                    if len(columns[-1]) != count:
+                        return None
+    except (struct.error, ValueError, OSError) as e:
+        print(e)
+        return None
+    audios = [dict(zip(KEYS, values)) for values in zip(*columns)]
+    for audio in audios:
+        audio['art_id'] = audio['art_id'] or None
+    return audios
+
+
+def remove_snapshot(filename=comun.SNAPSHOT_FILE):
+    '''
+    The snapshot is only valid until the library changes again
+    '''
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    import json
+    import tempfile
+    import time
+    from .librarystore import LibraryStore
+    directory = tempfile.mkdtemp()
+    audios = [{'hash': '{0:x}-{1:032x}'.format(4000000 + i, i),
+               'filepath': '/home/user/Music/Artist {0}/Album/{1:03d} - '
+                           'Track.mp3'.format(i // 12, i),
+               'title': 'Track {0}'.format(i),
+               'artist': 'Artist {0}'.format(i // 12),
+               'album': 'Album {0}'.format(i // 12),
+               'year': '2019', 'genre': 'Podcast', 'track': str(i % 12),
+               'length': 1800.5, 'position': 0.25, 'listened': i % 3 == 0,
+               'art': 'APIC:', 'art_id': '{0:032x}'.format(i // 12),
+               'content_hash': '{0:064x}'.format(i)}
+              for i in range(20000)]
+    filename = os.path.join(directory, 'snapshot.bin')
+    write_snapshot(audios, filename)
+    start = time.perf_counter()
+    snapshot = read_snapshot(filename)
+    snapshot_time = time.perf_counter() - start
+    assert [audio['hash'] for audio in snapshot] ==\
+        [audio['hash'] for audio in audios]
+    assert snapshot[3]['listened'] is True and snapshot[3]['art_id'] ==\
+        audios[3]['art_id']
+    data = json.dumps({'audios': audios})
+    start = time.perf_counter()
+    json.loads(data)
+    json_time = time.perf_counter() - start
+    library = LibraryStore(os.path.join(directory, 'library.db'))
+    library.replace(audios)
+    start = time.perf_counter()
+    library.load()
+    library_time = time.perf_counter() - start
+    library.close()
+    print('{0} tracks, snapshot {1} bytes'.format(
+        len(audios), os.path.getsize(filename)))
+    print('snapshot: {0:.1f} ms'.format(snapshot_time * 1000))
+    print('json:     {0:.1f} ms'.format(json_time * 1000))
+    print('library:  {0:.1f} ms'.format(library_time * 1000))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import locale
+import time
+
+COLLATED = ('artist', 'album', 'title')
+SORTS = ('artist', 'album', 'title', 'year', 'duration', 'listened',
+         'added')
+
+
+def get_collation_locale():
+    return locale.setlocale(locale.LC_COLLATE)
+
+
+def collate(audio):
+    '''
+    Store the locale collation keys of audio, sorting only compares them
+    '''
+    audio['collation'] = dict([(field, locale.strxfrm(
+        str(audio.get(field) or ''))) for field in COLLATED])
+
+
+def prepare(audio):
+    '''
+    What sorting needs of a track, when it enters the library
+    '''
+    if 'added' not in audio.keys():
+        audio['added'] = time.time()
+    collate(audio)
+
+
+def ensure_collation(audios, renew=False):
+    '''
+    Collate the audios without keys, every audio if renew. Returns the
+    audios that have changed
+    '''
+    changed = [audio for audio in audios
+               if renew or 'collation' not in audio.keys()]
+    for audio in changed:
+        collate(audio)
+    return changed
+
+
+def _number(value):
+    try:
+        return int(str(value).split('/')[0][:4])
+    except ValueError:
+        return 0
+
+
+def get_sort_key(order):
+    if order == 'artist':
+        return lambda audio: (audio['collation']['artist'],
+                              audio['collation']['album'],
+                              _number(audio.get('track')),
+                              audio['collation']['title'])
+    if order == 'album':
+        return lambda audio: (audio['collation']['album'],
+                              _number(audio.get('track')),
+                              audio['collation']['title'])
+    if order == 'title':
+        return lambda audio: audio['collation']['title']
+    if order == 'year':
+        return lambda audio: (_number(audio.get('year')),
+                              audio['collation']['album'],
+                              _number(audio.get('track')))
+    if order == 'duration':
+        return lambda audio: audio['length']
+    if order == 'listened':
+        return lambda audio: (audio['listened'], audio['position'])
+    if order == 'added':
+        return lambda audio: audio.get('added', 0)
+    raise ValueError(order)
+
+
+def sort_order(audios, order, reverse=False):
+    '''
+    The new position of every audio, as ListStore.reorder wants it: the
+    index in audios of the audio that goes first, second...
+    '''
+    keys = [key for key in map(get_sort_key(order), audios)]
+    return sorted(range(len(audios)), key=keys.__getitem__, reverse=reverse)
+
+
+if __name__ == '__main__':
+    import random
+    locale.setlocale(locale.LC_ALL, '')
+    random.seed(0)
+    names = ['Álvaro', 'alba', 'Zoe', 'Émile', 'eva', 'Ñandú', 'nube']
+    audios = [{'artist': random.choice(names), 'album': random.choice(names),
+               'title': random.choice(names),
+               'track': '{0}/12'.format(index % 12 + 1),
+               'year': str(1950 + index % 70), 'length': random.random(),
+               'listened': False, 'position': 0.0}
+              for index in range(100000)]
+    start = time.perf_counter()
+    for audio in audios:
+        prepare(audio)
+    print('collate: {0:.0f} ms'.format((time.perf_counter() - start) * 1000))
+    for order in SORTS:
+        start = time.perf_counter()
+        sort_order(audios, order)
+        print('{0}: {1:.0f} ms'.format(
+            order, (time.perf_counter() - start) * 1000))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gi
+try:
+    gi.require_version('GObject', '2.0')
+except Exception as e:
+    print(e)
+    exit(-1)
+from gi.repository import GObject
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import os
+from . import comun
+from .doitinbackground import IdleObject
+from .audio import Audio
+from .audio import get_art
+from .utils import THUMBNAIL_SIZES
+from .utils import create_thumbnails_from_data
+from .utils import get_art_id
+from .utils import get_thumbnail_filename
+from .utils import remove_thumbnails
+
+UNKNOWN = 'unknown'
+ART_LOCKS = 64
+
+
+class Thumbnailer(IdleObject):
+    '''
+    Build the thumbnails of the audios in a pool of worker threads.
+    GdkPixbuf releases the GIL while decoding, scaling and saving
+    '''
+    __gsignals__ = {
+        'thumbnail-ready': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                            (str, str)),
+    }
+
+    def __init__(self, workers=None):
+        IdleObject.__init__(self)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = Lock()
+        self.pending = set()
+        # Tracks of the same album share the art, one writer at a time
+        self.art_locks = [Lock() for i in range(ART_LOCKS)]
+        self.scale = 1
+
+    def get_art_lock(self, art_id):
+        return self.art_locks[int(art_id[:8], 16) % ART_LOCKS]
+
+    def set_scale(self, scale):
+        '''
+        Also render the thumbnails for this monitor scale factor
+        '''
+        self.scale = scale
+
+    def needs_thumbnail(self, audio):
+        if 'art_id' in audio.keys():
+            if audio['art_id'] is None:
+                return False
+            return not os.path.exists(get_thumbnail_filename(
+                audio['art_id'], THUMBNAIL_SIZES[-1], self.scale))
+        # Audios added before the art was recorded have no 'art' either
+        return audio.get('art', UNKNOWN) is not None
+
+    def request(self, audio):
+        '''
+        Queue the thumbnails of audio. Can be called from any thread
+        '''
+        if not self.needs_thumbnail(audio):
+            return
+        with self.lock:
+            if audio['hash'] in self.pending:
+                return
+            self.pending.add(audio['hash'])
+        self.executor.submit(self.build, audio['hash'], audio['filepath'],
+                             audio.get('art', UNKNOWN))
+
+    def build(self, hash, filepath, art):
+        try:
+            if art == UNKNOWN:
+                art = Audio(filepath)['art']
+            raw_data = get_art(filepath, art)
+            if raw_data is None:
+                art_id = None
+            else:
+                with self.get_art_lock(get_art_id(raw_data)):
+                    art_id = create_thumbnails_from_data(raw_data,
+                                                         self.scale)
+            # Thumbnails before the store were a png per track
+            legacy = os.path.join(comun.THUMBNAILS_DIR,
+                                  '{0}.png'.format(hash))
+            if os.path.exists(legacy):
+                os.remove(legacy)
+            self.emit('thumbnail-ready', hash, art_id or '')
+        except Exception as e:
+            print(e)
+        finally:
+            with self.lock:
+                self.pending.discard(hash)
+
+    def purge(self, art_ids):
+        '''
+        Remove the thumbnails of art_ids from the worker threads
+        '''
+        for art_id in art_ids:
+            self.executor.submit(self.remove, art_id)
+
+    def remove(self, art_id):
+        with self.get_art_lock(art_id):
+            remove_thumbnails(art_id)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+class TrackIndex(object):
+    '''
+    Maps the hash of every track in the library to its audio record and
+    to the row that shows it
+    '''
+    def __init__(self):
+        self.audios = {}
+        self.rows = {}
+
+    def add(self, audio, row=None):
+        self.audios[audio['hash']] = audio
+        if row is not None:
+            self.rows[audio['hash']] = row
+
+    def remove(self, hash):
+        self.audios.pop(hash, None)
+        self.rows.pop(hash, None)
+
+    def get_audio(self, hash):
+        return self.audios.get(hash)
+
+    def get_row(self, hash):
+        return self.rows.get(hash)
+
+    def get_hashes(self):
+        return self.audios.keys()
+
+    def clear(self):
+        self.audios.clear()
+        self.rows.clear()
+
+    def __contains__(self, hash):
+        return hash in self.audios
+
+    def __len__(self):
+        return len(self.audios)
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of lplayer
+#
+# Copyright (c) 2017-2019 Lorenzo Carbonell Cerezo <a.k.a. atareao>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gi
+try:
+    gi.require_version('Gtk', '3.0')
+    gi.require_version('Gdk', '3.0')
+    gi.require_version('GLib', '2.0')
+    gi.require_version('GObject', '2.0')
+    gi.require_version('GdkPixbuf', '2.0')
+    gi.require_version('Pango', '1.0')
+except Exception as e:
+    print(e)
+    exit(1)
+from gi.repository import Gtk
+from gi.repository import Gdk
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import GdkPixbuf
+from gi.repository import Pango
+import time
+from bisect import bisect_left
+from threading import Lock
+from . import comun
+from .pixbufcache import pixbuf_cache
+from .imageloader import ImageLoader
+
+INFO = GdkPixbuf.Pixbuf.new_from_file_at_size(comun.INFO_ICON, 16, 16)
+LISTENED = GdkPixbuf.Pixbuf.new_from_file_at_size(
+    comun.LISTENED_ICON, 16, 16)
+NOLISTENED = GdkPixbuf.Pixbuf.new_from_file_at_size(
+    comun.NOLISTENED_ICON, 16, 16)
+ACTIVE = Gdk.RGBA(1, 0, 0, 0.2)
+THUMBNAIL_SIZE = 80
+# Larger batches are applied with the model detached from the view
+DETACH_ROWS = 200
+MAX_LENGTH = 35
+
+
+def format_time(seconds):
+    return time.strftime('%H:%M:%S', time.gmtime(seconds))
+
+
+def shorten(text):
+    if len(text) > MAX_LENGTH:
+        return text[:MAX_LENGTH - 3] + '...'
+    return text
+
+
+class TrackRow(object):
+    '''
+    A track in the TrackView. Widgets are only drawn for visible rows, so
+    changing a row just asks the view to draw it again
+    '''
+    def __init__(self, view, audio, index):
+        self.view = view
+        self.audio = audio
+        self.index = index
+        self.active = False
+
+    def get_index(self):
+        return self.index
+
+    def set_audio(self, audio):
+        self.audio = audio
+        self.changed()
+
+    def set_active(self, active):
+        self.active = active
+        self.changed()
+
+    def get_active(self):
+        return self.active
+
+    def set_listened(self, listened):
+        self.audio['listened'] = listened
+        self.changed()
+
+    def set_position(self, position):
+        self.audio['position'] = position
+        self.changed()
+
+    def get_position(self):
+        return self.audio['position']
+
+    def get_duration(self):
+        return self.audio['length']
+
+    def set_thumbnail(self):
+        self.changed()
+
+    def changed(self):
+        self.view.row_changed(self)
+
+    def __eq__(self, other):
+        if other is not None and type(other) == TrackRow:
+            return self.audio['hash'] == other.audio['hash']
+        return False
+
+    __hash__ = object.__hash__
+
+
+class TrackView(Gtk.TreeView):
+    '''
+    The list of tracks, a TreeView over a ListStore of TrackRow. While
+    there is a search the view shows a second ListStore with only the
+    rows that match, and paths of the view are paths of that one
+    '''
+    __gsignals__ = {
+        'track-activated': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                            (object,)),
+        'track-selected': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                           (object,)),
+        'info-clicked': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                         (object,)),
+        'listened-clicked': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                             (object,)),
+        'position-changed': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                             (object, int)),
+        'rows-added': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+                       (object,)),
+    }
+
+    def __init__(self):
+        Gtk.TreeView.__init__(self)
+        self.store = Gtk.ListStore(object)
+        # The rows that match the search in the order of the store, None
+        # when there is no search
+        self.results = None
+        self.result_indexes = []
+        self.results_store = None
+        self.offset = 0
+        # Changes waiting to be applied together, see flush
+        self.lock = Lock()
+        self.pending_inserts = []
+        self.pending_removals = []
+        self.flush_scheduled = False
+        # The first visible row, thumbnails load by distance to it
+        self.top = 0
+        self.image_loader = ImageLoader()
+        self.image_loader.connect('image-loaded', self.on_image_loaded)
+        self.set_model(self.store)
+        self.set_headers_visible(False)
+        self.set_enable_search(False)
+        self.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+
+        self.column_art = self.append_track_column(
+            Gtk.CellRendererPixbuf(), self.render_art, THUMBNAIL_SIZE + 10)
+        self.column_art.get_cells()[0].set_padding(5, 5)
+        renderer = Gtk.CellRendererText()
+        renderer.set_property('ellipsize', Pango.EllipsizeMode.END)
+        self.column_text = self.append_track_column(renderer,
+                                                    self.render_text, 200)
+        self.column_text.set_expand(True)
+        self.column_position = self.append_track_column(
+            Gtk.CellRendererProgress(), self.render_position, 120)
+        self.column_listened = self.append_track_column(
+            Gtk.CellRendererPixbuf(), self.render_listened, 30)
+        self.column_info = self.append_track_column(
+            Gtk.CellRendererPixbuf(), self.render_info, 30)
+        # Every row has the same height, so only visible rows are measured
+        self.set_fixed_height_mode(True)
+
+        self.connect('row-activated', self.on_row_activated)
+        self.connect('notify::vadjustment', self.on_vadjustment_changed)
+        self.connect('button-press-event', self.on_button_press)
+        self.get_selection().connect('changed', self.on_selection_changed)
+
+    def append_track_column(self, renderer, render, width):
+        column = Gtk.TreeViewColumn()
+        column.pack_start(renderer, True)
+        column.set_cell_data_func(renderer, self.render_background, render)
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_fixed_width(width)
+        self.append_column(column)
+        return column
+
+    def render_background(self, column, renderer, model, treeiter, render):
+        row = model.get_value(treeiter, 0)
+        renderer.set_property('cell-background-rgba',
+                              ACTIVE if row.active else None)
+        render(renderer, row)
+
+    def render_art(self, renderer, row):
+        scale = self.get_scale_factor()
+        art_id = row.audio.get('art_id')
+        pixbuf = pixbuf_cache.lookup(art_id, THUMBNAIL_SIZE, scale)
+        if pixbuf is None:
+            # Never read from disk while drawing
+            if art_id is not None:
+                self.image_loader.request(
+                    art_id, THUMBNAIL_SIZE, scale,
+                    abs(row.index - self.offset - self.top))
+            pixbuf = pixbuf_cache.get_placeholder(THUMBNAIL_SIZE, scale)
+        if scale > 1:
+            renderer.set_property('surface',
+                                  Gdk.cairo_surface_create_from_pixbuf(
+                                      pixbuf, scale, self.get_window()))
+        else:
+            renderer.set_property('pixbuf', pixbuf)
+
+    def render_text(self, renderer, row):
+        audio = row.audio
+        markup = '<big><b>{0}</b></big>\n{1}\n{2} / {3}'.format(
+            GLib.markup_escape_text(shorten(audio['artist'])),
+            GLib.markup_escape_text(shorten(audio['title'])),
+            format_time(audio['length'] * audio['position']),
+            format_time(audio['length']))
+        renderer.set_property('markup', markup)
+
+    def render_position(self, renderer, row):
+        renderer.set_property('value', int(row.audio['position'] * 100))
+        renderer.set_property('text', '')
+        renderer.set_property('sensitive', row.active)
+
+    def render_listened(self, renderer, row):
+        renderer.set_property('pixbuf', LISTENED if row.audio['listened']
+                              else NOLISTENED)
+
+    def render_info(self, renderer, row):
+        renderer.set_property('pixbuf', INFO)
+
+    def on_vadjustment_changed(self, treeview, pspec):
+        adjustment = self.get_vadjustment()
+        if adjustment is not None:
+            adjustment.connect('value-changed', self.on_scrolled)
+
+    def on_scrolled(self, adjustment):
+        # What was queued may be out of view now
+        self.image_loader.cancel()
+        hit = self.get_path_at_pos(0, 0)
+        if hit is not None:
+            self.top = hit[0].get_indices()[0]
+
+    def on_image_loaded(self, loader, art_id, size, scale, pixbuf):
+        self.queue_draw()
+
+    def on_row_activated(self, treeview, path, column):
+        self.emit('track-activated', self.get_model()[path][0])
+
+    def on_selection_changed(self, selection):
+        rows = self.get_selected_rows()
+        self.emit('track-selected', rows[0] if len(rows) > 0 else None)
+
+    def on_button_press(self, widget, event):
+        if event.button != 1 or event.type != Gdk.EventType.BUTTON_PRESS:
+            return False
+        hit = self.get_path_at_pos(int(event.x), int(event.y))
+        if hit is None:
+            return False
+        path, column, cell_x, cell_y = hit
+        row = self.get_model()[path][0]
+        if column == self.column_info:
+            self.emit('info-clicked', row)
+            return True
+        if column == self.column_listened:
+            self.emit('listened-clicked', row)
+            return True
+        if column == self.column_position and row.active:
+            fraction = float(cell_x) / max(column.get_width(), 1)
+            self.emit('position-changed', row,
+                      int(min(max(fraction, 0.0), 1.0) * 100))
+            return True
+        return False
+
+    def add_audio(self, audio):
+        row = TrackRow(self, audio, self.offset + len(self.store))
+        self.store.append([row])
+        return row
+
+    def prepend_audio(self, audio):
+        '''
+        Add a track before the first one, while the rows before the first
+        screen are being built
+        '''
+        self.offset -= 1
+        row = TrackRow(self, audio, self.offset)
+        self.store.insert(0, [row])
+        return row
+
+    def set_offset(self, offset):
+        '''
+        The index of the first row, the view can be built from the middle
+        '''
+        self.offset = offset
+
+    def get_path(self, row):
+        return Gtk.TreePath(row.index - self.offset)
+
+    def get_result_path(self, row):
+        '''
+        The path of row in the results, None if it does not match
+        '''
+        position = bisect_left(self.result_indexes, row.index)
+        if position < len(self.results) and self.results[position] is row:
+            return Gtk.TreePath(position)
+        return None
+
+    def get_view_path(self, row):
+        '''
+        The path of row in the view, None while the search hides it
+        '''
+        if self.results is not None:
+            return self.get_result_path(row)
+        if self.get_row_at_index(row.index) is row:
+            return self.get_path(row)
+        return None
+
+    def get_index_for_path(self, path):
+        if self.results is not None:
+            return self.results[path.get_indices()[0]].index
+        return path.get_indices()[0] + self.offset
+
+    def set_matches(self, rows):
+        '''
+        Show only rows, every row if it is None. The rows go to a model of
+        their own, so a search costs what its results, not the library
+        '''
+        if rows is None and self.results is None:
+            return
+        attached = self.get_model() is not None
+        if attached:
+            state = self.detach()
+        if rows is None:
+            self.results = None
+            self.result_indexes = []
+            self.results_store = None
+        else:
+            self.results = sorted(rows, key=lambda row: row.index)
+            self.result_indexes = [row.index for row in self.results]
+            self.results_store = Gtk.ListStore(object)
+            for row in self.results:
+                self.results_store.append([row])
+        if attached:
+            self.attach(state)
+
+    def detach(self):
+        '''
+        Take the model out of the view, the changes made meanwhile do not
+        relayout it row by row
+        '''
+        selected = self.get_selected_rows()
+        adjustment = self.get_vadjustment()
+        value = adjustment.get_value() if adjustment else 0
+        self.set_model(None)
+        return selected, adjustment, value
+
+    def attach(self, state):
+        selected, adjustment, value = state
+        if self.results is None:
+            self.set_model(self.store)
+        else:
+            self.set_model(self.results_store)
+        for row in selected:
+            if self.get_row_at_index(row.index) is row:
+                self.select_row(row)
+        if adjustment:
+            adjustment.set_value(value)
+
+    def queue_insert(self, audio):
+        '''
+        Append a row for audio in the next batch. Can be called from any
+        thread, 'rows-added' tells the new rows
+        '''
+        with self.lock:
+            self.pending_inserts.append(audio)
+            self.schedule_flush()
+
+    def queue_remove(self, rows):
+        with self.lock:
+            self.pending_removals.extend(rows)
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            GLib.idle_add(self.flush)
+
+    def flush(self):
+        '''
+        Apply the queued changes at once: a single renumbering and, for
+        large batches, a single relayout
+        '''
+        with self.lock:
+            inserts, self.pending_inserts = self.pending_inserts, []
+            removals, self.pending_removals = self.pending_removals, []
+            self.flush_scheduled = False
+        if len(inserts) + len(removals) == 0:
+            return False
+        detach = len(inserts) + len(removals) > DETACH_ROWS
+        if detach:
+            state = self.detach()
+        if len(removals) > 0:
+            for row in sorted(set(removals), key=lambda row: row.index,
+                              reverse=True):
+                if self.get_row_at_index(row.index) is row:
+                    self.store.remove(self.store.get_iter(self.get_path(row)))
+            self.renumber()
+        rows = [self.add_audio(audio) for audio in inserts]
+        if detach:
+            self.attach(state)
+        if len(rows) > 0:
+            self.emit('rows-added', rows)
+        return False
+
+    def remove(self, row):
+        self.remove_rows([row])
+
+    def remove_rows(self, rows):
+        self.queue_remove(rows)
+        self.flush()
+
+    def clear(self):
+        self.store.clear()
+        self.offset = 0
+        if self.results is not None:
+            self.set_matches([])
+
+    def move_rows(self, rows, index):
+        '''
+        Move rows before the row at index, at the end if there is none
+        '''
+        moving = set([row.index for row in rows])
+        while index in moving:
+            index += 1
+        target = self.get_row_at_index(index)
+        if target is not None:
+            target = self.store.get_iter(self.get_path(target))
+        treeiters = [self.store.get_iter(self.get_path(row))
+                     for row in sorted(rows, key=lambda row: row.index)]
+        for treeiter in treeiters:
+            self.store.move_before(treeiter, target)
+        self.renumber()
+
+    def reorder(self, new_order):
+        '''
+        Put the rows in a new order, new_order[i] is the index of the row
+        that goes to position i. A single rows-reordered for the model
+        '''
+        self.store.reorder(new_order)
+        self.renumber()
+
+    def renumber(self):
+        for index, item in enumerate(self.store):
+            item[0].index = self.offset + index
+        if self.results is not None:
+            # Sorted again by the new indexes, without the removed rows
+            self.set_matches([row for row in self.results
+                              if self.get_row_at_index(row.index) is row])
+
+    def row_changed(self, row):
+        if self.get_row_at_index(row.index) is row:
+            path = self.get_path(row)
+            self.store.row_changed(path, self.store.get_iter(path))
+            if self.results is not None:
+                path = self.get_result_path(row)
+                if path is not None:
+                    self.results_store.row_changed(
+                        path, self.results_store.get_iter(path))
+
+    def get_n_rows(self):
+        return len(self.store)
+
+    def get_children(self):
+        return [item[0] for item in self.store]
+
+    def get_row_at_index(self, index):
+        index -= self.offset
+        if index >= 0 and index < len(self.store):
+            return self.store[index][0]
+        return None
+
+    def get_selected_rows(self):
+        model, paths = self.get_selection().get_selected_rows()
+        return [model[path][0] for path in paths]
+
+    def select_row(self, row):
+        if row is not None:
+            path = self.get_view_path(row)
+            if path is not None:
+                self.get_selection().select_path(path)
+
+    def unselect_all(self):
+        self.get_selection().unselect_all()
+
+    def scroll_to_row(self, row):
+        path = self.get_view_path(row)
+        if path is not None:
+            self.scroll_to_cell(path, None, False, 0, 0)
+
+
+if __name__ == '__main__':
+    # The UI side of a search: the model of the matches of 100k rows
+    view = TrackView()
+    window = Gtk.Window()
+    scrolledwindow = Gtk.ScrolledWindow()
+    scrolledwindow.add(view)
+    window.add(scrolledwindow)
+    window.set_default_size(400, 600)
+    window.show_all()
+    for index in range(100000):
+        view.add_audio({'hash': str(index), 'title': 'Title', 'artist': '',
+                        'length': 60, 'position': 0, 'listened': False,
+                        'art_id': None})
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    rows = view.get_children()
+    for name, matches in (('broad', rows[::2]),
+                          ('narrow', rows[:10]),
+                          ('none', None)):
+        start = time.perf_counter()
+        view.set_matches(matches)
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+        print('{0}: {1:.1f} ms'.format(
+            name, (time.perf_counter() - start) * 1000))
@@ -32,9 +32,12 @@ except Exception as e:
     exit(1)
 from gi.repository import GdkPixbuf
 import base64
+import glob
+import hashlib
 import os
 import re
 import subprocess
+import tempfile
 import io
 from PIL import Image
 try:
@@ -49,6 +52,7 @@ except Exception as e:
 
 
 NOIMAGE = GdkPixbuf.Pixbuf.new_from_file_at_size(comun.NOIMAGE_ICON, 256, 256)
+THUMBNAIL_SIZES = (24, 80, 256)
 
 
 def select_value_in_combo(combo, value):
@@ -68,7 +72,12 @@ def get_selected_value_in_combo(combo):
 def get_pixbuf_from_base64string(base64string):
     if base64string is None:
         return NOIMAGE
-    raw_data = base64.b64decode(base64string.encode())
+    return get_pixbuf_from_data(base64.b64decode(base64string.encode()))
+
+
+def get_pixbuf_from_data(raw_data):
+    if raw_data is None:
+        return NOIMAGE
     try:
         pixbuf_loader = GdkPixbuf.PixbufLoader.new_with_mime_type("image/jpeg")
         pixbuf_loader.write(raw_data)
@@ -87,28 +96,68 @@ def get_pixbuf_from_base64string(base64string):
         print(e)
     return NOIMAGE
 
-def get_thumbnail_filename_for_audio(audio):
-    thumbnail_filename = os.path.join(comun.THUMBNAILS_DIR,
-                                      '{0}.png'.format(audio['hash']))
-    if not os.path.exists(thumbnail_filename):
-        if 'thumbnail_base64' in audio.keys():
-            pixbuf = get_pixbuf_from_base64string(audio['thumbnail_base64'])
-        else:
-            pixbuf = NOIMAGE
-        pixbuf.savev(thumbnail_filename, 'png', [], [])
-    return thumbnail_filename
-
-
-def create_thumbnail_for_audio(hash, thumbnail_base64):
-    thumbnail_filename = os.path.join(comun.THUMBNAILS_DIR,
-                                      '{0}.png'.format(hash))
-    if not os.path.exists(thumbnail_filename):
-        if thumbnail_base64 is not None:
-            pixbuf = get_pixbuf_from_base64string(thumbnail_base64)
-        else:
-            pixbuf = NOIMAGE
-        pixbuf = pixbuf.scale_simple(256, 256, GdkPixbuf.InterpType.BILINEAR)
-        pixbuf.savev(thumbnail_filename, 'png', [], [])
+
+def get_art_id(raw_data):
+    return hashlib.blake2b(raw_data, digest_size=16).hexdigest()
+
+
+def get_thumbnail_filename(art_id, size, scale=1):
+    if scale > 1:
+        return os.path.join(comun.THUMBNAILS_DIR,
+                            '{0}-{1}@{2}x.jpg'.format(art_id, size, scale))
+    return os.path.join(comun.THUMBNAILS_DIR,
+                        '{0}-{1}.jpg'.format(art_id, size))
+
+
+def get_thumbnail_filename_for_audio(audio, size=256):
+    if audio.get('art_id') is not None:
+        thumbnail_filename = get_thumbnail_filename(audio['art_id'], size)
+        if os.path.exists(thumbnail_filename):
+            return thumbnail_filename
+    return comun.NOIMAGE_ICON
+
+
+def create_thumbnails_from_data(raw_data, scale=1):
+    '''
+    Store the artwork in every thumbnail size, keyed by the hash of its
+    content so tracks with the same cover share the files. Returns the
+    art id, or None if the artwork can't be decoded
+    '''
+    if raw_data is None:
+        return None
+    art_id = get_art_id(raw_data)
+    missing = []
+    for size in THUMBNAIL_SIZES:
+        for ascale in sorted(set([1, scale])):
+            if not os.path.exists(get_thumbnail_filename(art_id, size,
+                                                         ascale)):
+                missing.append((size, ascale))
+    if len(missing) > 0:
+        pixbuf = get_pixbuf_from_data(raw_data)
+        if pixbuf is NOIMAGE:
+            return None
+        for size, ascale in missing:
+            thumbnail_filename = get_thumbnail_filename(art_id, size, ascale)
+            thumbnail = pixbuf.scale_simple(size * ascale, size * ascale,
+                                            GdkPixbuf.InterpType.BILINEAR)
+            # Write aside and rename so a reader never sees half a file.
+            # The name is unique, another writer may be on the same art
+            fd, temporal = tempfile.mkstemp(suffix='.tmp',
+                                            dir=comun.THUMBNAILS_DIR)
+            os.close(fd)
+            try:
+                thumbnail.savev(temporal, 'jpeg', ['quality'], ['90'])
+                os.replace(temporal, thumbnail_filename)
+            except Exception:
+                os.remove(temporal)
+                raise
+    return art_id
+
+
+def remove_thumbnails(art_id):
+    for thumbnail_filename in glob.glob(os.path.join(
+            comun.THUMBNAILS_DIR, '{0}-*.jpg'.format(art_id))):
+        os.remove(thumbnail_filename)
 
 
 def is_running(process):